@@ -1,67 +1,372 @@
-from flask import Flask, render_template, request, jsonify, send_file
+from flask import Flask, render_template, request, jsonify, send_file, Response, stream_with_context
 from lxml import etree as LET
-from xml_engine.diff import parse_tree, compute_issues
-from xml_engine.utils import render_full_tree_with_injected, token_diff_html, escape_xml
+from xml_engine.diff import (
+    parse_tree, compute_issues, issues_for_pair, aligned_pair_of, IssueStream, export_issues,
+    EXPORT_FORMATS, ISSUE_KINDS, attr_issue_kind, configure_rules
+)
+from xml_engine.jobs import JOBS, EXECUTOR, JobCancelled, submit_job
+from concurrent.futures import ThreadPoolExecutor
+from xml_engine.store import BackgroundStore, open_store
+from xml_engine.snapshot import SnapshotWriter, SnapshotError, read_snapshot, read_cursor
+from xml_engine.buffer import MappedDocument
+from xml_engine import metrics, tokens
+from xml_engine.metrics import stage
+from xml_engine.utils import (
+    render_full_tree_with_injected, token_diff_html, escape_xml, find_by_steps, doc_order_key,
+    build_path, local_name
+)
 from xml_engine.hardindex import (
     index_element_text_spans, index_attribute_value_spans,
-    build_path_key, apply_replacements
+    build_path_key, apply_replacements, shift_spans, is_plain_span, TAIL
 )
 
-import os, traceback
+import os, traceback, gzip, json, bisect, threading, itertools
 from collections import Counter
 from datetime import datetime 
-from flask_pymongo import PyMongo 
 import pytz 
 
+try:
+    import zstandard
+except ImportError:  # optional: gzip is always available
+    zstandard = None
+
 app = Flask(__name__)
 os.makedirs("output", exist_ok=True)
+# Review log backend: "mongo", "sqlite" (single file under DOC_WORKDIR) or "memory"
+app.config["STORE"] = os.environ.get("STORE", "mongo")
 app.config["MONGO_URI"] = os.environ.get('MONGO_URI', 'mongodb://localhost:27017/xml_proofing')
-mongo = PyMongo(app)
+app.config["MONGO_POOL_SIZE"] = int(os.environ.get("MONGO_POOL_SIZE", "10"))
+# "memory": raw documents are Python str; "mmap": UTF-8 files in DOC_WORKDIR read via mmap
+app.config["DOC_BUFFER"] = os.environ.get("DOC_BUFFER", "memory")
+app.config["DOC_WORKDIR"] = os.environ.get("DOC_WORKDIR", "work")
+# Stage timers + /metrics (off by default: near-zero overhead); SERVER_TIMING adds the header
+app.config["METRICS"] = os.environ.get("METRICS", "0") == "1"
+app.config["SERVER_TIMING"] = os.environ.get("SERVER_TIMING", "0") == "1"
+metrics.enable(app.config["METRICS"])
+app.config["SQLITE_PATH"] = os.environ.get(
+    "SQLITE_PATH", os.path.join(app.config["DOC_WORKDIR"], "xmlproof.sqlite3"))
+# Connects on the first write, never at import; writes happen off the request thread
+store = BackgroundStore(open_store(app.config["STORE"], uri=app.config["MONGO_URI"],
+                                   pool_size=app.config["MONGO_POOL_SIZE"], path=app.config["SQLITE_PATH"]))
+# Session snapshot: rewritten in the background after changes, restored on first use
+app.config["SNAPSHOT"] = os.environ.get("SNAPSHOT", "1") == "1"
+app.config["SNAPSHOT_PATH"] = os.environ.get(
+    "SNAPSHOT_PATH", os.path.join(app.config["DOC_WORKDIR"], "session.snap"))
+snapshots = SnapshotWriter(app.config["SNAPSHOT_PATH"]) if app.config["SNAPSHOT"] else None
+# Optional JSON file replacing the detection rule table: {"<local name>" or "*": [checks]}
+app.config["DETECTION_RULES"] = os.environ.get("DETECTION_RULES")
+if app.config["DETECTION_RULES"]:
+    with open(app.config["DETECTION_RULES"], encoding="utf-8") as f:
+        configure_rules(json.load(f))
 
 STATE = {
     "left_tree": None, "right_tree": None,
-    "issues": [], "idx": 0,
-    "accepted": [],
+    "issues": [], "idx": 0, "only": None,
+    "accepted": [], "redo": [],
     "raw_left": None, "raw_right": None,
     "left_text_spans": None, "right_text_spans": None,
     "left_attr_spans": None, "right_attr_spans": None,
+    "version": 0, "saved_version": None,
+    "job": None,   # id of the background /diff job that owns this state, if any
+    "stream": None,   # IssueStream filling "issues" on demand, if detection is lazy
 }
 
+# Prefix for ETags so a restarted worker never matches a stale client cache
+BOOT_ID = os.urandom(4).hex()
+COMPRESS_MIN_BYTES = 1024
+
 def ser_steps(steps): return [[ln, idx] for (ln, idx) in steps]
 def de_steps(obj): return tuple((ln, int(idx)) for ln, idx in obj)
 
+def bump_version():
+    """Mark the documents/issues as changed (invalidates /render and /download ETags)."""
+    STATE["version"] += 1
+
+def as_raw(side, text):
+    """Hold `text` as the raw buffer for `side`: the str itself, or an mmap-backed file."""
+    if app.config["DOC_BUFFER"] != "mmap":
+        return text
+    return MappedDocument.from_text(os.path.join(app.config["DOC_WORKDIR"], f"{side}.xml"), text)
+
+def raw_for_log(raw):
+    """
+    A raw document as the review log keeps it: the str itself, or a mapped
+    document's UTF-8 bytes, copied as they are (never decoded on the request).
+    """
+    return raw.buf[:] if isinstance(raw, MappedDocument) else raw
+
+def same_raw(stored, text):
+    if isinstance(stored, MappedDocument):
+        return stored.matches(text)
+    return stored == text
+
+def write_output(path, raw):
+    if isinstance(raw, MappedDocument):
+        raw.copy_to(path)
+        return
+    with open(path, "wb") as f:
+        f.write((raw or "").encode("utf-8", errors="replace"))
+
+def write_outputs():
+    """Write current buffers to output/ so downloads reflect real-time state."""
+    with stage("write"):
+        write_output(os.path.join("output", "final_left.xml"), STATE["raw_left"])
+        write_output(os.path.join("output", "final_right.xml"), STATE["raw_right"])
+    STATE["saved_version"] = STATE["version"]
+
+def read_upload(field):
+    """Read an uploaded file, transparently inflating gzip-compressed uploads."""
+    data = request.files[field].read()
+    if data[:2] == b"\x1f\x8b":
+        data = gzip.decompress(data)
+    return data.decode("utf-8", errors="replace")
+
+def pick_encoding():
+    accepted = request.accept_encodings
+    if zstandard is not None and accepted["zstd"]:
+        return "zstd"
+    if accepted["gzip"]:
+        return "gzip"
+    return None
+
+def full_etag(etag, encoding):
+    # Strong ETags are per representation, so the encoding is part of the tag
+    return f"{BOOT_ID}-{etag}" + (f"-{encoding}" if encoding else "")
+
+def not_modified(etag):
+    """304 response if the client already holds `etag` (in any encoding we'd send), else None."""
+    for encoding in (pick_encoding(), None):
+        tag = full_etag(etag, encoding)
+        if request.if_none_match.contains(tag):
+            resp = Response(status=304)
+            resp.set_etag(tag)
+            resp.headers["Vary"] = "Accept-Encoding"
+            resp.headers["Cache-Control"] = "no-cache"
+            return resp
+    return None
+
+def send_payload(body: bytes, mimetype: str, etag: str = None, download_name: str = None):
+    """
+    Send `body` compressed (zstd/gzip, per Accept-Encoding) with a strong ETag, if given.
+    Answers 304 when the client's If-None-Match already holds this representation.
+    """
+    encoding = pick_encoding() if len(body) >= COMPRESS_MIN_BYTES else None
+    tag = full_etag(etag, encoding) if etag is not None else None
+
+    if tag is not None and request.if_none_match.contains(tag):
+        resp = Response(status=304)
+    else:
+        with stage("compress"):
+            if encoding == "zstd":
+                body = zstandard.ZstdCompressor(level=3).compress(body)
+            elif encoding == "gzip":
+                body = gzip.compress(body, compresslevel=6)
+        resp = Response(body, mimetype=mimetype)
+        if encoding:
+            resp.headers["Content-Encoding"] = encoding
+        if download_name:
+            resp.headers["Content-Disposition"] = f'attachment; filename="{download_name}"'
+    if tag is not None:
+        resp.set_etag(tag)
+        resp.headers["Cache-Control"] = "no-cache"   # always revalidate
+    resp.headers["Vary"] = "Accept-Encoding"
+    return resp
+
+@app.before_request
+def _begin_metrics():
+    metrics.begin_request(request.endpoint)
+
+@app.after_request
+def _end_metrics(resp):
+    stages = metrics.end_request()
+    if stages and app.config["SERVER_TIMING"]:
+        resp.headers["Server-Timing"] = metrics.server_timing(stages)
+    return resp
+
+@app.route("/metrics")
+def metrics_route():
+    return Response(metrics.render_prometheus(), mimetype="text/plain; version=0.0.4")
+
+# ---------- session snapshots ----------
+
+# Endpoints that never need the previous session (a fresh /diff replaces it, and
+# job polls must not restore it while that /diff's job is still parsing)
+NO_RESTORE_ENDPOINTS = {"static", "home", "diff_route", "metrics_route", "job_status", "job_cancel"}
+_restore = {"pending": app.config["SNAPSHOT"], "lock": threading.Lock()}
+# version of the last full snapshot, and (version, idx) of the last cursor handed to the writer
+_snapshot_key = {"version": None, "cursor": None}
+
+def capture_snapshot():
+    """What a snapshot needs from STATE, copied so the writer thread can't see later edits."""
+    if STATE["left_tree"] is None:
+        return None
+    if STATE["stream"] is not None and (not STATE["stream"].done or STATE["stream"].stopped):
+        return None   # detection still running (or cancelled); only a finished list is saved
+    raws = [r[:] if isinstance(r, MappedDocument) else r for r in (STATE["raw_left"], STATE["raw_right"])]
+    data = {
+        "raw_left": raws[0], "raw_right": raws[1],
+        "meta": {
+            "idx": STATE["idx"], "only": STATE["only"], "version": STATE["version"],
+            "buffer": app.config["DOC_BUFFER"],
+            "accepted": [_journal_entry(it) for it in STATE["accepted"]],
+            "redo": [_journal_entry(it) for it in STATE["redo"]],
+        },
+        "issues": list(STATE["issues"]),
+    }
+    for name in ("left_text_spans", "right_text_spans", "left_attr_spans", "right_attr_spans"):
+        data[name] = dict(STATE[name]) if STATE[name] is not None else None
+    return data
+
+def _journal_entry(it):
+    """Copy of an accepted entry with mmap-mode (bytes) delta texts as str, for JSON."""
+    it = dict(it)
+    d = it.get("delta")
+    if d is not None and isinstance(d["old"], bytes):
+        it["delta"] = {**d, "old": d["old"].decode("utf-8"), "new": d["new"].decode("utf-8")}
+    return it
+
+def schedule_snapshot():
+    """
+    Full snapshot when the session version changed (documents, issues, journal);
+    a cursor move alone only rewrites the tiny cursor sidecar.
+    """
+    if snapshots is None:
+        return
+    version, cursor = STATE["version"], (STATE["version"], STATE["idx"])
+    if version != _snapshot_key["version"]:
+        data = capture_snapshot()
+        if data is not None:
+            _snapshot_key.update(version=version, cursor=cursor)
+            snapshots.schedule(data)
+    elif cursor != _snapshot_key["cursor"]:
+        _snapshot_key["cursor"] = cursor
+        snapshots.schedule_cursor({"version": version, "idx": STATE["idx"]})
+
+def _restore_steps(d, *fields):
+    for f in fields:
+        if d.get(f) is not None:
+            d[f] = de_steps(d[f])
+    return d
+
+def restore_snapshot(path):
+    """Rebuild STATE from a snapshot: reparse the raws, but reuse issues and indexes as stored."""
+    with stage("restore"):
+        snap = read_snapshot(path)
+    meta = snap["meta"]
+    with stage("parse"):
+        left_tree, right_tree = parse_tree(snap["raw_left"]), parse_tree(snap["raw_right"])
+    issues = [_restore_steps(it, "steps", "steps_right") for it in snap["issues"]]
+    reset_state(left_tree, right_tree, snap["raw_left"], snap["raw_right"], issues, only=meta.get("only"))
+
+    accepted, redo = meta.get("accepted", []), meta.get("redo", [])
+    for it in accepted + redo:
+        _restore_steps(it, "steps", "steps_right")
+        d = it.get("delta")
+        if d is not None:
+            _restore_steps(d, "steps")
+            if app.config["DOC_BUFFER"] == "mmap":
+                d["old"], d["new"] = d["old"].encode("utf-8"), d["new"].encode("utf-8")
+    spans = {name: snap[name] for name in
+             ("left_text_spans", "right_text_spans", "left_attr_spans", "right_attr_spans")}
+    if meta.get("buffer") != app.config["DOC_BUFFER"]:
+        # offsets were in the other buffer's units (chars vs UTF-8 bytes): rebuild lazily
+        spans = dict.fromkeys(spans)
+        for it in accepted:
+            it.pop("delta", None)
+        redo = []
+    version = meta.get("version", STATE["version"])
+    cursor = read_cursor(path, version) or meta
+    STATE.update(spans)
+    STATE.update({
+        "accepted": accepted, "redo": redo, "version": version,
+        "idx": min(cursor.get("idx", 0), max(0, len(issues) - 1)),
+    })
+    _snapshot_key.update(version=STATE["version"], cursor=(STATE["version"], STATE["idx"]))
+
+@app.before_request
+def _restore_session():
+    """After a restart, bring back the last session the first time it is needed."""
+    if not _restore["pending"] or request.endpoint in NO_RESTORE_ENDPOINTS:
+        return
+    with _restore["lock"]:
+        if not _restore["pending"]:
+            return
+        _restore["pending"] = False
+        if STATE["left_tree"] is not None or not os.path.exists(app.config["SNAPSHOT_PATH"]):
+            return
+        try:
+            restore_snapshot(app.config["SNAPSHOT_PATH"])
+        except (OSError, ValueError, SnapshotError):
+            traceback.print_exc()
+
+@app.after_request
+def _snapshot_session(resp):
+    try:
+        schedule_snapshot()
+    except Exception:
+        traceback.print_exc()
+    return resp
+
+def record_documents(raw_left, raw_right, left_tree, right_tree):
+    """Per-request size/element counters (skipped entirely when metrics are off)."""
+    if not metrics.enabled():
+        return
+    for side, raw, tree in (("left", raw_left, left_tree), ("right", raw_right, right_tree)):
+        # UTF-8 bytes, not characters: non-ASCII books are the large ones
+        size = len(raw) if isinstance(raw, MappedDocument) else len(raw.encode("utf-8"))
+        metrics.observe("xmlproof_document_bytes", size, side=side)
+        metrics.observe("xmlproof_document_elements", sum(1 for _ in tree.iter()), side=side)
+
+def record_issues(issues, route=None):
+    """route: defaults to the current request's endpoint (pass one outside a request)."""
+    metrics.observe("xmlproof_issues", len(issues), route=route or request.endpoint)
+
 @app.route("/")
 def home():
     return render_template("index.html")
 
 @app.route("/diff", methods=["POST"])
 def diff_route():
+    # The upload replaces any session a restart left on disk: never restore it later
+    with _restore["lock"]:
+        _restore["pending"] = False
     try:
-        raw_left  = request.files["original"].read().decode("utf-8", errors="replace")
-        raw_right = request.files["modified"].read().decode("utf-8", errors="replace")
+        raw_left  = read_upload("original")
+        raw_right = read_upload("modified")
 
         only_kind = request.form.get("only")
         if only_kind == "all":
             only_kind = None
-        if only_kind not in {"gibberish", "duplicate", "footnote", None}:
+        if only_kind not in ISSUE_KINDS:
             only_kind = None
 
-        same_files = (STATE["raw_left"] == raw_left and STATE["raw_right"] == raw_right)
-        if same_files and STATE["left_tree"] is not None and STATE["right_tree"] is not None:
-            left_tree, right_tree = STATE["left_tree"], STATE["right_tree"]
-        else:
-            left_tree  = parse_tree(raw_left)
-            right_tree = parse_tree(raw_right)
+        # A new upload supersedes whatever job is still working on the old one
+        cancel_current_job()
+
+        if request.form.get("mode") == "job":
+            job = submit_job(lambda job: run_diff_job(job, raw_left, raw_right, only_kind),
+                             before_start=lambda job: STATE.update(job=job.id))
+            return jsonify(job.to_dict()), 202
 
-        issues = compute_issues(left_tree, right_tree, only=only_kind)
+        if request.form.get("mode") == "lazy":
+            # Issues are produced as /render and /navigate ask for them; a background
+            # pass completes the scan so /stats totals fill in.
+            left_tree, right_tree = parse_pair(raw_left, raw_right)
+            record_documents(raw_left, raw_right, left_tree, right_tree)
+            stream = IssueStream(left_tree, right_tree, only=only_kind)
+            reset_state(left_tree, right_tree, raw_left, raw_right, stream=stream, only=only_kind)
+            with stage("detect"):
+                stream.ensure(1)
+            EXECUTOR.submit(drain_stream, stream)
+            return jsonify({"count": len(stream.issues), "byKind": dict(stream.by_kind),
+                            "complete": stream.done})
 
-        STATE.update({
-            "left_tree": left_tree, "right_tree": right_tree,
-            "issues": issues, "idx": 0, "accepted": [],
-            "raw_left": raw_left, "raw_right": raw_right,
-            "left_text_spans": None, "right_text_spans": None,
-            "left_attr_spans": None, "right_attr_spans": None,
-        })
+        left_tree, right_tree = parse_pair(raw_left, raw_right)
+        record_documents(raw_left, raw_right, left_tree, right_tree)
+        with stage("detect"):
+            issues = compute_issues(left_tree, right_tree, only=only_kind)
+        record_issues(issues)
+        reset_state(left_tree, right_tree, raw_left, raw_right, issues, only=only_kind)
 
         kinds = Counter([i["kind"] for i in issues])
         return jsonify({"count": len(issues), "byKind": dict(kinds)})
@@ -69,6 +374,108 @@ def diff_route():
         traceback.print_exc()
         return jsonify({"error": str(e)}), 500
 
+def parse_pair(raw_left, raw_right):
+    same_files = same_raw(STATE["raw_left"], raw_left) and same_raw(STATE["raw_right"], raw_right)
+    if same_files and STATE["left_tree"] is not None and STATE["right_tree"] is not None:
+        return STATE["left_tree"], STATE["right_tree"]
+    with stage("parse"):
+        return parse_tree(raw_left), parse_tree(raw_right)
+
+def reset_state(left_tree, right_tree, raw_left, raw_right, issues=None, stream=None, only=None):
+    old = (STATE["raw_left"], STATE["raw_right"])
+    for tree in (STATE["left_tree"], STATE["right_tree"]):
+        if tree is not None and tree is not left_tree and tree is not right_tree:
+            tokens.forget(tree)
+    set_issues(stream.issues if stream is not None else issues, stream)
+    STATE.update({
+        "left_tree": left_tree, "right_tree": right_tree,
+        "idx": 0, "only": only, "accepted": [], "redo": [],
+        "raw_left": as_raw("left", raw_left), "raw_right": as_raw("right", raw_right),
+        "left_text_spans": None, "right_text_spans": None,
+        "left_attr_spans": None, "right_attr_spans": None,
+    })
+    for raw in old:
+        if isinstance(raw, MappedDocument):
+            raw.close()
+    bump_version()
+
+def set_issues(issues, stream=None):
+    """Replace the issue list, stopping any lazy stream that was still filling the old one."""
+    if STATE["stream"] is not None and STATE["stream"] is not stream:
+        STATE["stream"].close()
+    STATE["stream"] = stream
+    STATE["issues"] = issues
+
+def drain_stream(stream):
+    """Background pass for lazy /diff: finish the scan, then snapshot the full list."""
+    stream.drain()
+    if STATE["stream"] is stream:
+        schedule_snapshot()
+
+def pull_issues(count, kind=None):
+    """With lazy detection, make sure `count` issues (of `kind`) exist if the documents have them."""
+    if STATE["stream"] is not None:
+        with stage("detect"):
+            STATE["stream"].ensure(count, kind)
+
+def recompute_issues(only=None):
+    """Eagerly re-detect issues on the current trees (after edits or a filter change)."""
+    with stage("detect"):
+        set_issues(compute_issues(STATE["left_tree"], STATE["right_tree"], only=only))
+    STATE["only"] = only
+    record_issues(STATE["issues"])
+
+# ---------- background /diff jobs ----------
+
+def run_diff_job(job, raw_left, raw_right, only_kind):
+    job.stage = "parse"
+    left_tree, right_tree = parse_pair(raw_left, raw_right)
+    record_documents(raw_left, raw_right, left_tree, right_tree)
+    job.check()
+    if STATE["job"] != job.id:
+        raise JobCancelled(job.id)   # a newer upload owns the session now
+    # Publish a lazy stream right away: /render pulls ahead on demand while this job
+    # completes the scan, so review can start before detection finishes
+    stream = IssueStream(left_tree, right_tree, only=only_kind, progress=job.progress, stop=job.stop)
+    reset_state(left_tree, right_tree, raw_left, raw_right, stream=stream, only=only_kind)
+    job.stage = "detect"
+    with stage("detect"):
+        stream.drain(check=job.check)
+    job.check()
+    record_issues(stream.issues, route="background")   # stage timers label job work the same way
+    schedule_snapshot()
+
+def current_job():
+    job = JOBS.get(STATE["job"]) if STATE["job"] else None
+    return job if job is not None and job.active else None
+
+def cancel_current_job():
+    job = current_job()
+    if job is not None:
+        job.cancel()
+
+def job_busy():
+    """409 response while a background job is still filling STATE, else None."""
+    job = current_job()
+    if job is None:
+        return None
+    return jsonify({"ok": False, "error": "diff job still running", **job.to_dict()}), 409
+
+@app.route("/jobs/<job_id>")
+def job_status(job_id):
+    job = JOBS.get(job_id)
+    if job is None:
+        return jsonify({"error": "unknown job"}), 404
+    return jsonify(job.to_dict())
+
+@app.route("/jobs/<job_id>/cancel", methods=["POST"])
+def job_cancel(job_id):
+    job = JOBS.get(job_id)
+    if job is None:
+        return jsonify({"error": "unknown job"}), 404
+    job.cancel()
+    return jsonify(job.to_dict())
+
 def filtered_indices(issue_type):
     if issue_type == "all":
         return list(range(len(STATE["issues"])))
@@ -76,50 +483,100 @@ def filtered_indices(issue_type):
 
 @app.route("/stats")
 def stats():
+    return jsonify(stats_payload())
+
+def stats_payload():
     kinds = Counter([i["kind"] for i in STATE["issues"]])
     total = len(STATE["issues"])
-    return jsonify({"total": total, "byKind": dict(kinds)})
+    resp = {"total": total, "byKind": dict(kinds),
+            "complete": STATE["stream"] is None or (STATE["stream"].done and not STATE["stream"].stopped)}
+    job = current_job()
+    if job is not None:
+        resp["job"] = job.to_dict()   # totals are partial until the job is done
+    return resp
 
 @app.route("/render")
 def render_current():
     try:
         issue_type = request.args.get("type", "gibberish")
-        idxs = filtered_indices(issue_type)
-        if not idxs:
-            return jsonify({"left": "", "right": "", "pos": 0, "count": 0})
-
-        view_count  = len(idxs)
-        global_idx  = idxs[min(STATE["idx"], view_count - 1)]
-        d           = STATE["issues"][global_idx]
-
-        kind   = d["kind"]
-        stepsL = d.get("steps")
-        stepsR = d.get("steps_right", stepsL)
-        attr   = d.get("attr")
-
-        dup_side = "none"
-
-        if kind == "duplicate" and d.get("right_highlight"):
-            left_frag   = escape_xml(d.get("old",""))
-            right_frag  = d["right_highlight"]
-            render_kind = "text"
-            dup_side    = "right"   # RIGHT has surplus -> copy LEFT→RIGHT
-        elif kind == "duplicate" and d.get("left_highlight"):
-            left_frag   = d["left_highlight"]
-            right_frag  = escape_xml(d.get("new",""))
-            render_kind = "text"
-            dup_side    = "left"    # LEFT has surplus -> copy RIGHT→LEFT
-        elif kind == "duplicate" and d.get("highlighted_html"):
-            left_frag   = d["highlighted_html"]
-            right_frag  = d["highlighted_html"]
-            render_kind = "text"
-            dup_side    = "none"
+        # Current issue plus one more, so the count shows whether there is a next
+        pull_issues(STATE["idx"] + 2, issue_type)
+        cached = not_modified(render_etag(issue_type, STATE["idx"]))
+        if cached is not None:
+            return cached
+        etag, body = render_body(issue_type, STATE["idx"])
+        prefetch_render(issue_type, STATE["idx"] + 1)
+        return send_payload(body, "application/json", etag)
+    except Exception as e:
+        traceback.print_exc()
+        return jsonify({"left": "", "right": "", "pos": 0, "count": 0, "error": str(e)}), 500
+
+# ---------- render cache + prefetch ----------
+
+# JSON bodies of recent renders by ETag: the current issue and the prefetched next one
+RENDER_CACHE = {}
+RENDER_CACHE_SIZE = 8
+_render_lock = threading.Lock()
+# One worker: prefetches are cheap to drop, and must not compete with /diff jobs
+PREFETCH = ThreadPoolExecutor(max_workers=1, thread_name_prefix="prefetch")
+_prefetching = set()
+
+def render_etag(issue_type, idx):
+    # Output depends only on (documents/issues version, filter, cursor)
+    return f"render-{STATE['version']}-{len(STATE['issues'])}-{issue_type}-{idx}"
+
+def cached_tokens(side, steps, tail=False):
+    """The token cache entry for the .text (or .tail) of `side`'s element at steps."""
+    tree = STATE[f"{side}_tree"]
+    elem = find_by_steps(tree.getroot(), steps)
+    return None if elem is None else tokens.cache_for(tree).get(elem, "tail" if tail else "text")
+
+def render_payload(issue_type, idx):
+    """Both panes with issue `idx` of the `issue_type` view injected, plus its metadata."""
+    idxs = filtered_indices(issue_type)
+    if not idxs:
+        return {"left": "", "right": "", "pos": 0, "count": 0}
+
+    view_count  = len(idxs)
+    global_idx  = idxs[min(idx, view_count - 1)]
+    d           = STATE["issues"][global_idx]
+
+    kind   = d["kind"]
+    stepsL = d.get("steps")
+    stepsR = d.get("steps_right", stepsL)
+    attr   = d.get("attr")
+
+    dup_side = "none"
+
+    if kind == "duplicate" and d.get("right_highlight"):
+        left_frag   = escape_xml(d.get("old",""))
+        right_frag  = d["right_highlight"]
+        render_kind = "tail" if d.get("tail") else "text"
+        dup_side    = "right"   # RIGHT has surplus -> copy LEFT→RIGHT
+    elif kind == "duplicate" and d.get("left_highlight"):
+        left_frag   = d["left_highlight"]
+        right_frag  = escape_xml(d.get("new",""))
+        render_kind = "tail" if d.get("tail") else "text"
+        dup_side    = "left"    # LEFT has surplus -> copy RIGHT→LEFT
+    elif kind == "duplicate" and d.get("highlighted_html"):
+        left_frag   = d["highlighted_html"]
+        right_frag  = d["highlighted_html"]
+        render_kind = "text"
+        dup_side    = "none"
+    else:
+        old_text = d.get("old",""); new_text = d.get("new","")
+        if kind in ("footnote", "attribute") and attr:
+            render_kind = "attr"
+            old_tokens = new_tokens = None
         else:
-            old_text = d.get("old",""); new_text = d.get("new","")
-            left_frag, right_frag = token_diff_html(old_text, new_text)
-            render_kind = "attr" if (kind == "footnote" and attr) else "text"
-            dup_side    = "none"
+            render_kind = "tail" if d.get("tail") else "text"
+            old_tokens = cached_tokens("left",  stepsL, d.get("tail"))
+            new_tokens = cached_tokens("right", stepsR, d.get("tail"))
+        with stage("diff"):
+            left_frag, right_frag = token_diff_html(old_text, new_text, old_tokens, new_tokens)
+        dup_side    = "none"
 
+    with stage("render"):
         left_html  = render_full_tree_with_injected(
             STATE["left_tree"].getroot(),  stepsL, left_frag,  kind=render_kind, attr=attr
         )
@@ -127,24 +584,64 @@ def render_current():
             STATE["right_tree"].getroot(), stepsR, right_frag, kind=render_kind, attr=attr
         )
 
-        return jsonify({
+    return {
         "left": left_html, "right": right_html,
         "pos": idxs.index(global_idx)+1, "count": view_count,
         "steps": ser_steps(stepsL),
         "steps_right": ser_steps(stepsR),
-        "kind": render_kind,            # "text" or "attr" for rendering
-        "issue_kind": d["kind"],        # 👈 real kind: "duplicate" | "gibberish" | "footnote"
+        "kind": render_kind,            # "text", "tail" or "attr" for rendering
+        "issue_kind": d["kind"],        # 👈 real kind: "duplicate" | "gibberish" | "footnote" | "attribute"
         "attr": attr or None,
+        "tail": bool(d.get("tail")),
         "dup_side": dup_side
-    })
-    except Exception as e:
+    }
+
+def render_body(issue_type, idx):
+    """(ETag, JSON body) for issue `idx` of the view, from the cache when possible."""
+    pull_issues(idx + 2, issue_type)
+    etag = render_etag(issue_type, idx)
+    body = RENDER_CACHE.get(etag)
+    if body is None:
+        version = STATE["version"]
+        body = json.dumps(render_payload(issue_type, idx)).encode("utf-8")
+        with _render_lock:
+            if STATE["version"] == version:   # an edit raced the render: don't keep it
+                RENDER_CACHE[etag] = body
+                while len(RENDER_CACHE) > RENDER_CACHE_SIZE:
+                    RENDER_CACHE.pop(next(iter(RENDER_CACHE)))
+    return etag, body
+
+def prefetch_render(issue_type, idx):
+    """Render issue `idx` in the background so stepping to it is a cache hit."""
+    if idx >= len(STATE["issues"]) and (STATE["stream"] is None or STATE["stream"].done):
+        return
+    key = (STATE["version"], issue_type, idx)
+    with _render_lock:
+        if key in _prefetching:
+            return
+        _prefetching.add(key)
+    PREFETCH.submit(_prefetch, key)
+
+def _prefetch(key):
+    version, issue_type, idx = key
+    try:
+        if STATE["version"] == version and STATE["left_tree"] is not None:
+            render_body(issue_type, idx)
+    except Exception:
         traceback.print_exc()
-        return jsonify({"left": "", "right": "", "pos": 0, "count": 0, "error": str(e)}), 500
+    finally:
+        with _render_lock:
+            _prefetching.discard(key)
 
 @app.route("/navigate", methods=["POST"])
 def navigate():
     d = request.get_json()
-    direction = d.get("dir")
+    move_cursor(d.get("dir"))
+    return jsonify({"ok": True})
+
+def move_cursor(direction):
+    if direction in ("next", "next_wrap"):
+        pull_issues(STATE["idx"] + 2)
     if direction == "next":
         STATE["idx"] = min(STATE["idx"] + 1, max(0, len(STATE["issues"]) - 1))
     elif direction == "prev":
@@ -156,27 +653,47 @@ def navigate():
             STATE["idx"] = 0
         else:
             STATE["idx"] = (STATE["idx"] + 1) % len(STATE["issues"]) 
-    return jsonify({"ok": True})
 
 @app.route("/accept", methods=["POST"])
 def accept():
-    d = request.get_json()
+    busy = job_busy()
+    if busy is not None:
+        return busy
+    body, status = accept_edit(request.get_json())
+    return jsonify(body), status
+
+def detected_kind(stepsL, attr, tail):
+    """Kind of the open issue an accept resolves, or None if it isn't in the list."""
+    for it in STATE["issues"]:
+        if tuple(it["steps"]) == stepsL and it.get("attr") == attr and bool(it.get("tail")) == tail:
+            return it["kind"]
+    return None
 
-    # Always rebuild span indexes to avoid stale caches after prior edits
-    STATE["left_text_spans"]  = index_element_text_spans(STATE["raw_left"])
-    STATE["right_text_spans"] = index_element_text_spans(STATE["raw_right"])
-    STATE["left_attr_spans"]  = index_attribute_value_spans(STATE["raw_left"])
-    STATE["right_attr_spans"] = index_attribute_value_spans(STATE["raw_right"])
+def accept_edit(d):
+    """Copy one issue's text/attribute between sides; returns (response body, HTTP status)."""
+    # Span indexes are shifted in place by every edit (replace_span), so only
+    # build them when something invalidated them
+    ensure_span_indexes()
 
     kind      = d.get("kind", "text")
     direction = d.get("direction", "left_to_right")   # "left_to_right" or "right_to_left"
     stepsL    = de_steps(d["steps"])                  # LEFT anchor
     stepsR    = de_steps(d.get("steps_right", d["steps"]))  # RIGHT anchor (fallback)
     # For footnote UI, we send kind="attr" from the client but keep attr name always
-    attr      = (d.get("attr") or "").split(":")[-1] if kind in ("attr", "footnote") else None
+    attr      = local_name(d.get("attr") or "") if kind in ("attr", "footnote", "attribute") else None
+    if kind in ("footnote", "attribute"):
+        kind = "attr"
+    # Mixed content: the text after the element (its tail) rather than its .text
+    tail      = bool(d.get("tail")) and kind != "attr"
+
+    # What the report calls this edit: the detected issue's kind, not the request's
+    issue_kind = (detected_kind(stepsL, attr, tail)
+                  or (attr_issue_kind(stepsL[-1][0]) if kind == "attr" else kind))
 
     keyL = build_path_key(stepsL)
     keyR = build_path_key(stepsR)
+    if tail:
+        keyL, keyR = keyL + TAIL, keyR + TAIL
 
     # ---- compute spans and source/dest text ----
     if kind == "attr":
@@ -190,165 +707,346 @@ def accept():
             r_span = STATE["right_attr_spans"].get(f"{keyR}@{attr}")
         if not l_span or not r_span:
             # Fallback: mutate trees directly using steps and reserialize
-            def _find_by_steps(root_elem, steps):
-                cur = root_elem
-                for ln, idx in steps[1:]:  # skip root itself
-                    count = 0
-                    target = None
-                    for child in cur:
-                        if not isinstance(child.tag, str):
-                            continue
-                        name = child.tag
-                        if "}" in name: name = name.split("}", 1)[1]
-                        if ":" in name: name = name.split(":", 1)[1]
-                        if name == ln:
-                            count += 1
-                            if count == idx:
-                                target = child
-                                break
-                    if target is None:
-                        return None
-                    cur = target
-                return cur
-
             src_tree  = STATE["right_tree"] if direction == "right_to_left" else STATE["left_tree"]
             dest_tree = STATE["left_tree"]  if direction == "right_to_left" else STATE["right_tree"]
-            src_elem  = _find_by_steps(src_tree.getroot(), stepsR if direction == "right_to_left" else stepsL)
-            dst_elem  = _find_by_steps(dest_tree.getroot(), stepsL if direction == "right_to_left" else stepsR)
+            src_elem  = find_by_steps(src_tree.getroot(), stepsR if direction == "right_to_left" else stepsL)
+            dst_elem  = find_by_steps(dest_tree.getroot(), stepsL if direction == "right_to_left" else stepsR)
             if src_elem is None or dst_elem is None:
-                return jsonify({
+                return {
                     "ok": False,
                     "error": "attr span missing and fallback locate failed",
                     "left_key": f"{keyL}@{attr}",
                     "right_key": f"{keyR}@{attr}"
-                }), 400
+                }, 400
             # Copy attribute value (local name match)
-            src_attrs = {k.split(":")[-1]: v for k, v in src_elem.attrib.items()}
+            src_attrs = {local_name(k): v for k, v in src_elem.attrib.items()}
             if attr not in src_attrs:
                 # nothing to copy
-                return jsonify({"ok": False, "error": "source attr missing"}), 400
+                return {"ok": False, "error": "source attr missing"}, 400
             dst_attrs = dict(dst_elem.attrib)
             # Preserve original attribute key name if present, else use attr
             dst_key = None
             for k in dst_elem.attrib.keys():
-                if k.split(":")[-1] == attr:
+                if local_name(k) == attr:
                     dst_key = k; break
             if dst_key is None:
                 dst_key = attr
             dst_elem.attrib[dst_key] = src_attrs[attr]
             # Reserialize the mutated destination side back to raw strings
-            if direction == "right_to_left":
-                STATE["raw_left"] = LET.tostring(dest_tree, encoding="unicode")
-                STATE["left_tree"] = parse_tree(STATE["raw_left"])
-            else:
-                STATE["raw_right"] = LET.tostring(dest_tree, encoding="unicode")
-                STATE["right_tree"] = parse_tree(STATE["raw_right"])
+            dest = "left" if direction == "right_to_left" else "right"
+            old_raw = STATE[f"raw_{dest}"][:]
+            STATE[f"raw_{dest}"] = as_raw(dest, LET.tostring(dest_tree, encoding="unicode"))
+            reparse_side(dest)
             # invalidate spans
             STATE["left_text_spans"] = STATE["right_text_spans"] = None
             STATE["left_attr_spans"] = STATE["right_attr_spans"] = None
             # record and persist below
             entry = {
                 "kind": kind,
+                "issue_kind": issue_kind,
                 "steps": stepsL,
                 "steps_right": stepsR,
                 "direction": direction,
                 "already_applied": True,
-                "attr": attr
+                "attr": attr,
+                # whole-document inverse delta: the reserialization can touch anything
+                "delta": {"side": dest, "start": 0, "old": old_raw,
+                          "new": STATE[f"raw_{dest}"][:], "whole": True},
             }
             STATE["accepted"].append(entry)
+            STATE["redo"] = []
             # recompute issues after fallback apply
             try:
-                STATE["issues"] = compute_issues(STATE["left_tree"], STATE["right_tree"], only=None)
+                recompute_issues()
                 STATE["idx"] = min(STATE["idx"], max(0, len(STATE["issues"]) - 1))
             except Exception:
                 traceback.print_exc()
+            bump_version()
             # persist files
             try:
-                outL = os.path.join("output", "final_left.xml")
-                outR = os.path.join("output", "final_right.xml")
-                with open(outL, "wb") as f:
-                    f.write((STATE["raw_left"] or "").encode("utf-8", errors="replace"))
-                with open(outR, "wb") as f:
-                    f.write((STATE["raw_right"] or "").encode("utf-8", errors="replace"))
+                write_outputs()
             except Exception:
                 traceback.print_exc()
-            return jsonify({"ok": True, "remaining": len(STATE["issues"])})
-        (ls, le), (rs, re) = l_span, r_span
-        src = STATE["raw_left"][ls:le] if direction == "left_to_right" else STATE["raw_right"][rs:re]
-        # apply to dest side (in-memory)
-        if direction == "left_to_right":
-            STATE["raw_right"] = apply_replacements(STATE["raw_right"], [(rs, re, src)])
-        else:
-            STATE["raw_left"]  = apply_replacements(STATE["raw_left"],  [(ls, le, src)])
+            return {"ok": True, "remaining": len(STATE["issues"])}, 200
     else:
         l_span = STATE["left_text_spans"].get(keyL)
         r_span = STATE["right_text_spans"].get(keyR)
         if not l_span or not r_span:
-            return jsonify({"ok": False, "error": "text span missing"}), 400
-        (ls, le), (rs, re) = l_span, r_span
-        src = STATE["raw_left"][ls:le] if direction == "left_to_right" else STATE["raw_right"][rs:re]
-        if direction == "left_to_right":
-            STATE["raw_right"] = apply_replacements(STATE["raw_right"], [(rs, re, src)])
-        else:
-            STATE["raw_left"]  = apply_replacements(STATE["raw_left"],  [(ls, le, src)])
+            return {"ok": False, "error": "text span missing"}, 400
 
-    # ---- reparse the side we just changed so /render shows it immediately ----
-    try:
-        if direction == "left_to_right":
-            STATE["right_tree"] = parse_tree(STATE["raw_right"])
-        else:
-            STATE["left_tree"]  = parse_tree(STATE["raw_left"])
-    except Exception as e:
-        traceback.print_exc()
-        return jsonify({"ok": False, "error": f"reparse failed: {e}"}), 500
+    # ---- copy source text over the dest span (in-memory), remembering what it replaced ----
+    (ls, le), (rs, re) = l_span, r_span
+    if direction == "left_to_right":
+        dest, dest_steps, (ds, de), src = "right", stepsR, (rs, re), STATE["raw_left"][ls:le]
+        src_side, src_steps, (ss, se) = "left", stepsL, (ls, le)
+    else:
+        dest, dest_steps, (ds, de), src = "left", stepsL, (ls, le), STATE["raw_right"][rs:re]
+        src_side, src_steps, (ss, se) = "right", stepsR, (rs, re)
+    old_raw   = STATE[f"raw_{dest}"][ds:de]
+    old_value = tree_value(STATE[f"{dest}_tree"], dest_steps, attr, tail)
+    # Character data parses to exactly the source element's value, so the dest
+    # tree can be edited in place, keeping every other node (and its cached
+    # tokens); text involving CDATA is reparsed instead
+    in_place = kind == "attr" or (is_plain_span(STATE[f"raw_{src_side}"], ss, se)
+                                  and is_plain_span(STATE[f"raw_{dest}"], ds, de))
+    replace_span(dest, ds, de, src)
 
-    # Invalidate span caches (they depend on raw strings)
-    STATE["left_text_spans"] = STATE["right_text_spans"] = None
-    STATE["left_attr_spans"] = STATE["right_attr_spans"] = None
+    if in_place:
+        set_tree_value(STATE[f"{dest}_tree"], dest_steps, attr,
+                       tree_value(STATE[f"{src_side}_tree"], src_steps, attr, tail), tail)
+    else:
+        # ---- reparse the side we just changed so /render shows it immediately ----
+        try:
+            with stage("reparse"):
+                reparse_side(dest)
+        except Exception as e:
+            traceback.print_exc()
+            return {"ok": False, "error": f"reparse failed: {e}"}, 500
 
-    # Keep a record (but mark already applied so /apply won’t double-apply)
+    # Keep a record (but mark already applied so /apply won’t double-apply),
+    # with the inverse delta /undo needs
     entry = {
         "kind": kind,
+        "issue_kind": issue_kind,
         "steps": stepsL,
         "steps_right": stepsR,
         "direction": direction,
-        "already_applied": True
+        "already_applied": True,
+        "delta": {
+            "side": dest, "start": ds, "old": old_raw, "new": src,
+            "steps": dest_steps, "attr": attr, "tail": tail,
+            "old_value": old_value,
+            "new_value": tree_value(STATE[f"{dest}_tree"], dest_steps, attr, tail),
+        },
     }
     if kind == "attr":
         entry["attr"] = attr
+    if tail:
+        entry["tail"] = True
     STATE["accepted"].append(entry)
-
-    # --- SAVE to MongoDB --- 
-    mongo.db.accepted.insert_one({ 
-        "kind": kind, 
-        "steps": stepsL, 
-        "steps_right": stepsR, 
-        "direction": direction, 
-        "attr": attr, 
-        "raw_left": STATE["raw_left"], 
-        "raw_right": STATE["raw_right"] 
-        })
+    STATE["redo"] = []
 
     # Recompute issues from current trees so UI reflects real-time state
     try:
-        STATE["issues"] = compute_issues(STATE["left_tree"], STATE["right_tree"], only=None)
+        recompute_issues()
         STATE["idx"] = min(STATE["idx"], max(0, len(STATE["issues"]) - 1))
     except Exception:
         traceback.print_exc()
+    bump_version()
 
     # ---- persist current buffers immediately so downloads reflect real-time state ----
     try:
-        outL = os.path.join("output", "final_left.xml")
-        outR = os.path.join("output", "final_right.xml")
-        with open(outL, "wb") as f:
-            f.write((STATE["raw_left"] or "").encode("utf-8", errors="replace"))
-        with open(outR, "wb") as f:
-            f.write((STATE["raw_right"] or "").encode("utf-8", errors="replace"))
+        write_outputs()
+    except Exception:
+        traceback.print_exc()
+
+    # --- SAVE to the review log (queued: the edit stands whatever the store does) ---
+    with stage("persist"):
+        store.insert("accepted", {
+            "kind": kind,
+            "issue_kind": issue_kind,
+            "steps": stepsL,
+            "steps_right": stepsR,
+            "direction": direction,
+            "attr": attr,
+            "raw_left": raw_for_log(STATE["raw_left"]),
+            "raw_right": raw_for_log(STATE["raw_right"])
+            })
+
+    return {"ok": True, "remaining": len(STATE["issues"])}, 200
+
+
+# ---------- edits, and the inverse-delta undo/redo journal ----------
+
+def ensure_span_indexes():
+    with stage("index"):
+        for side in ("left", "right"):
+            if STATE[f"{side}_text_spans"] is None:
+                STATE[f"{side}_text_spans"] = index_element_text_spans(STATE[f"raw_{side}"])
+            if STATE[f"{side}_attr_spans"] is None:
+                STATE[f"{side}_attr_spans"] = index_attribute_value_spans(STATE[f"raw_{side}"])
+
+def replace_span(side, start, end, text):
+    """Replace raw[start:end] on `side` with text, shifting that side's span indexes to match."""
+    with stage("apply"):
+        STATE[f"raw_{side}"] = apply_replacements(STATE[f"raw_{side}"], [(start, end, text)])
+        shift_spans(STATE[f"{side}_text_spans"], start, end, len(text))
+        shift_spans(STATE[f"{side}_attr_spans"], start, end, len(text))
+
+def tree_value(tree, steps, attr=None, tail=False):
+    """Parsed .text (.tail, or attribute value by local name) of the element at steps."""
+    elem = find_by_steps(tree.getroot(), steps)
+    if elem is None:
+        return None
+    if not attr:
+        return elem.tail if tail else elem.text
+    for k, v in elem.attrib.items():
+        if local_name(k) == attr:
+            return v
+    return None
+
+def set_tree_value(tree, steps, attr, value, tail=False):
+    """Edit the element at steps in place; a text edit drops only that element's cached tokens."""
+    elem = find_by_steps(tree.getroot(), steps)
+    if elem is None:
+        return
+    if not attr:
+        if tail:
+            elem.tail = value
+        else:
+            elem.text = value
+        tokens.cache_for(tree).invalidate(elem)
+        return
+    key = next((k for k in elem.attrib.keys() if local_name(k) == attr), attr)
+    if value is None:
+        elem.attrib.pop(key, None)
+    else:
+        elem.attrib[key] = value
+
+def reparse_side(side):
+    """Replace `side`'s tree with a fresh parse of its raw buffer (new nodes, new token cache)."""
+    tokens.forget(STATE[f"{side}_tree"])
+    STATE[f"{side}_tree"] = parse_tree(STATE[f"raw_{side}"])
+
+def refresh_issues_at(side, steps):
+    """
+    Re-run detection for the ONE aligned pair holding the element at `steps` on
+    `side`, splicing its issues into document order. The pair is looked up by
+    position, the way detection pairs elements, so its partner is the element
+    compute_issues() would compare, even where the two sides' paths differ.
+    The result is a new list: an /export still walking the old one isn't disturbed.
+    """
+    issues = STATE["issues"]
+    if STATE["stream"] is not None:
+        STATE["stream"].drain()   # finish the list before splicing into it
+    elem = find_by_steps(STATE[f"{side}_tree"].getroot(), steps)
+    pair = aligned_pair_of(STATE["left_tree"], STATE["right_tree"], elem) if elem is not None else None
+    if pair is None:   # no counterpart on the other side: re-detect everything
+        set_issues(compute_issues(STATE["left_tree"], STATE["right_tree"], only=STATE["only"]))
+        return
+    stepsL = build_path(pair[0])
+    kept = [it for it in issues if tuple(it["steps"]) != stepsL]
+    fresh = issues_for_pair(pair[0], pair[1], STATE["only"])
+    if fresh:
+        root = STATE["left_tree"].getroot()
+        target = doc_order_key(root, stepsL)
+        at = bisect.bisect_left(kept, target, key=lambda it: doc_order_key(root, it["steps"]))
+        kept[at:at] = fresh
+    set_issues(kept)   # the drained stream has nothing left to add
+
+def apply_delta(entry, forward):
+    """Undo (forward=False) or redo (forward=True) one accepted edit from its inverse delta."""
+    d = entry["delta"]
+    side = d["side"]
+    cur, new = (d["old"], d["new"]) if forward else (d["new"], d["old"])
+    if d.get("whole"):
+        # whole-document delta (tree fallback path): swap the buffer and reparse
+        STATE[f"raw_{side}"] = apply_replacements(STATE[f"raw_{side}"], [(0, len(cur), new)])
+        reparse_side(side)
+        STATE[f"{side}_text_spans"] = STATE[f"{side}_attr_spans"] = None
+        recompute_issues(STATE["only"])
+    else:
+        replace_span(side, d["start"], d["start"] + len(cur), new)
+        set_tree_value(STATE[f"{side}_tree"], d["steps"], d["attr"],
+                       d["new_value"] if forward else d["old_value"], d.get("tail", False))
+        with stage("detect"):
+            refresh_issues_at(side, tuple(d["steps"]))
+    STATE["idx"] = min(STATE["idx"], max(0, len(STATE["issues"]) - 1))
+    bump_version()
+    try:
+        write_outputs()
     except Exception:
         traceback.print_exc()
 
-    return jsonify({"ok": True, "remaining": len(STATE["issues"])})
+def journal_state():
+    return {
+        "undo": sum(1 for it in STATE["accepted"] if "delta" in it),
+        "redo": len(STATE["redo"]),
+        "remaining": len(STATE["issues"]),
+    }
+
+def step_journal(forward):
+    """Undo (forward=False) or redo the latest edit; returns (response body, HTTP status)."""
+    if forward:
+        if not STATE["redo"]:
+            return {"ok": False, "error": "nothing to redo", **journal_state()}, 400
+        entry = STATE["redo"].pop()
+        apply_delta(entry, forward=True)
+        STATE["accepted"].append(entry)
+    else:
+        if not STATE["accepted"] or "delta" not in STATE["accepted"][-1]:
+            return {"ok": False, "error": "nothing to undo", **journal_state()}, 400
+        entry = STATE["accepted"].pop()
+        apply_delta(entry, forward=False)
+        STATE["redo"].append(entry)
+    return {"ok": True, **journal_state()}, 200
+
+@app.route("/undo", methods=["POST"])
+def undo():
+    busy = job_busy()
+    if busy is not None:
+        return busy
+    body, status = step_journal(forward=False)
+    return jsonify(body), status
+
+@app.route("/redo", methods=["POST"])
+def redo():
+    busy = job_busy()
+    if busy is not None:
+        return busy
+    body, status = step_journal(forward=True)
+    return jsonify(body), status
+
+# ---------- combined review action ----------
+
+ACTIONS = {"accept", "reject", "next", "prev", "undo", "redo", "none"}
+
+@app.route("/action", methods=["POST"])
+def action():
+    """
+    One round trip for the review UI: perform `action`, then answer with its result,
+    the issue counts and the render of the (new) current issue:
+
+        {"action": "accept", "type": "gibberish", "steps": [...], "kind": ..., ...}
+        -> {"action": ..., "result": {...}, "stats": {...}, "render": {...}}
 
+    accept takes the same fields as /accept; reject skips to the next issue
+    (wrapping), like Reject + /navigate next_wrap. The render of the issue after
+    the new current one is prefetched in the background.
+    """
+    d = request.get_json() or {}
+    act = d.get("action", "none")
+    issue_type = d.get("type", "gibberish")
+    if act not in ACTIONS:
+        return jsonify({"ok": False, "error": f"unknown action {act!r}"}), 400
+    if act in ("accept", "undo", "redo"):
+        busy = job_busy()
+        if busy is not None:
+            return busy
+
+    result, status = {"ok": True}, 200
+    if act == "accept":
+        result, status = accept_edit(d)
+    elif act == "reject":
+        move_cursor("next_wrap")
+    elif act in ("next", "prev"):
+        move_cursor(act)
+    elif act in ("undo", "redo"):
+        result, status = step_journal(forward=(act == "redo"))
+
+    try:
+        etag, render = render_body(issue_type, STATE["idx"])
+    except Exception as e:
+        traceback.print_exc()
+        render = json.dumps({"left": "", "right": "", "pos": 0, "count": 0, "error": str(e)}).encode("utf-8")
+    prefetch_render(issue_type, STATE["idx"] + 1)
+
+    # splice the (possibly cached) render body in without re-encoding it
+    head = json.dumps({"action": act, "result": result, "stats": stats_payload()})
+    body = head[:-1].encode("utf-8") + b', "render": ' + render + b"}"
+    resp = send_payload(body, "application/json")
+    resp.status_code = status
+    return resp
 
 @app.route("/reject", methods=["POST"])
 def reject():
@@ -356,18 +1054,22 @@ def reject():
 
 @app.route("/apply", methods=["POST"])
 def apply():
+    busy = job_busy()
+    if busy is not None:
+        return busy
     # Only apply items not already applied by /accept
     to_apply = [it for it in STATE["accepted"] if not it.get("already_applied")]
     applied_left = applied_right = 0
 
     if to_apply:
         # build indexes lazily
-        if STATE["left_text_spans"] is None or STATE["right_text_spans"] is None:
-            STATE["left_text_spans"]  = index_element_text_spans(STATE["raw_left"])
-            STATE["right_text_spans"] = index_element_text_spans(STATE["raw_right"])
-        if STATE["left_attr_spans"] is None or STATE["right_attr_spans"] is None:
-            STATE["left_attr_spans"]  = index_attribute_value_spans(STATE["raw_left"])
-            STATE["right_attr_spans"] = index_attribute_value_spans(STATE["raw_right"])
+        with stage("index"):
+            if STATE["left_text_spans"] is None or STATE["right_text_spans"] is None:
+                STATE["left_text_spans"]  = index_element_text_spans(STATE["raw_left"])
+                STATE["right_text_spans"] = index_element_text_spans(STATE["raw_right"])
+            if STATE["left_attr_spans"] is None or STATE["right_attr_spans"] is None:
+                STATE["left_attr_spans"]  = index_attribute_value_spans(STATE["raw_left"])
+                STATE["right_attr_spans"] = index_attribute_value_spans(STATE["raw_right"])
 
         reps_left, reps_right = [], []
         for item in to_apply:
@@ -375,6 +1077,8 @@ def apply():
             stepsR = item.get("steps_right", stepsL)
             keyL = build_path_key(stepsL)
             keyR = build_path_key(stepsR)
+            if item.get("tail"):
+                keyL, keyR = keyL + TAIL, keyR + TAIL
             direction = item.get("direction", "left_to_right")
 
             if item.get("kind") == "attr":
@@ -399,35 +1103,40 @@ def apply():
                 else:
                     reps_left.append((ls, le, STATE["raw_right"][rs:re]));  applied_left  += 1
 
-        if reps_left:
-            STATE["raw_left"]  = apply_replacements(STATE["raw_left"],  reps_left)
-        if reps_right:
-            STATE["raw_right"] = apply_replacements(STATE["raw_right"], reps_right)
+        with stage("apply"):
+            if reps_left:
+                STATE["raw_left"]  = apply_replacements(STATE["raw_left"],  reps_left)
+            if reps_right:
+                STATE["raw_right"] = apply_replacements(STATE["raw_right"], reps_right)
 
         # mark those as applied so we don't re-apply next time
         for it in to_apply:
             it["already_applied"] = True
+        # batch edits moved offsets under the journal's deltas: history ends here
+        for it in STATE["accepted"]:
+            it.pop("delta", None)
+        STATE["redo"] = []
 
         # reparse after batch apply
-        STATE["left_tree"]  = parse_tree(STATE["raw_left"])
-        STATE["right_tree"] = parse_tree(STATE["raw_right"])
+        with stage("reparse"):
+            reparse_side("left")
+            reparse_side("right")
         STATE["left_text_spans"] = STATE["right_text_spans"] = None
         STATE["left_attr_spans"] = STATE["right_attr_spans"] = None
+        bump_version()
 
     # ✅ Always write what we currently have to disk (even if 0 newly applied)
-    outL = os.path.join("output", "final_left.xml")
-    outR = os.path.join("output", "final_right.xml")
-    with open(outL, "wb") as f: f.write(STATE["raw_left"].encode("utf-8", errors="replace"))
-    with open(outR, "wb") as f: f.write(STATE["raw_right"].encode("utf-8", errors="replace"))
-
-    # --- SAVE final XML to MongoDB --- 
-    mongo.db.final_versions.insert_one({ 
-        "raw_left": STATE["raw_left"], 
-        "raw_right": STATE["raw_right"], 
-        "applied_left": applied_left, 
-        "applied_right": applied_right, 
-        "created_at": datetime.now(pytz.timezone("Asia/Kolkata")).strftime("%Y-%m-%d %H:%M:%S") 
-        })
+    write_outputs()
+
+    # --- SAVE final XML to the review log --- 
+    with stage("persist"):
+        store.insert("final_versions", { 
+            "raw_left": raw_for_log(STATE["raw_left"]), 
+            "raw_right": raw_for_log(STATE["raw_right"]), 
+            "applied_left": applied_left, 
+            "applied_right": applied_right, 
+            "created_at": datetime.now(pytz.timezone("Asia/Kolkata")).strftime("%Y-%m-%d %H:%M:%S") 
+            })
 
     resp = {
         "applied_left": applied_left,
@@ -440,23 +1149,95 @@ def apply():
     return jsonify(resp)
 
 
+def send_output(side):
+    path = os.path.join("output", f"final_{side}.xml")
+    if STATE["saved_version"] is None:
+        # written by an earlier process; let send_file derive its own validators
+        return send_file(path, as_attachment=True)
+    etag = f"download-{side}-{STATE['saved_version']}"
+    cached = not_modified(etag)
+    if cached is not None:
+        return cached
+    with open(path, "rb") as f:
+        body = f.read()
+    return send_payload(body, "application/xml", etag, download_name=f"final_{side}.xml")
+
 @app.route("/download/left")
 def download_left():
-    return send_file(os.path.join("output", "final_left.xml"), as_attachment=True)
+    return send_output("left")
 
 @app.route("/download/right")
 def download_right():
-    return send_file(os.path.join("output", "final_right.xml"), as_attachment=True)
+    return send_output("right")
+
+# ---------- issue report export ----------
+
+EXPORT_MIMETYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+# Issues pulled from a lazy stream at a time while exporting
+EXPORT_PULL = 500
+
+def iter_live_issues(issues, stream):
+    """Walk an issue list by index, pulling a lazy stream forward as the walk catches up."""
+    i = 0
+    while True:
+        if i >= len(issues):
+            if stream is None or not stream.pull(EXPORT_PULL):
+                return
+            continue
+        yield issues[i]
+        i += 1
+
+def journal_issues(accepted):
+    """Accepted edits as report rows (their before/after values, where recorded)."""
+    for it in accepted:
+        delta = it.get("delta") or {}
+        kind = it.get("issue_kind") or it.get("kind", "text")   # entries from older snapshots
+        yield {
+            "kind": attr_issue_kind(it["steps"][-1][0]) if kind == "attr" else kind,
+            "steps": it["steps"], "steps_right": it.get("steps_right"), "attr": it.get("attr"),
+            "tail": it.get("tail", False),
+            "old": delta.get("old_value"), "new": delta.get("new_value"), "status": "accepted",
+        }
+
+@app.route("/export")
+def export_report():
+    """
+    Stream every issue as NDJSON (default) or CSV: ?format=ndjson|csv&type=<kind>|all.
+    Accepted edits come first (status "accepted"), then the open issues.
+    """
+    fmt = request.args.get("format", "ndjson")
+    issue_type = request.args.get("type", "all")
+    if fmt not in EXPORT_FORMATS:
+        return jsonify({"error": f"format must be one of {', '.join(EXPORT_FORMATS)}"}), 400
+    if STATE["left_tree"] is None:
+        return jsonify({"error": "no documents"}), 400
+
+    # Hold on to this session's lists: a new /diff mid-download doesn't mix sessions
+    issues, stream, accepted = STATE["issues"], STATE["stream"], list(STATE["accepted"])
+    accepted_keys = {(build_path_key(it["steps"]) + (TAIL if it.get("tail") else ""), it.get("attr") or "")
+                     for it in accepted}
+    rows = itertools.chain(journal_issues(accepted), iter_live_issues(issues, stream))
+    if issue_type != "all":
+        rows = (it for it in rows if it["kind"] == issue_type)
+
+    chunks = (c.encode("utf-8") for c in export_issues(rows, fmt, accepted_keys))
+    resp = Response(stream_with_context(chunks), mimetype=EXPORT_MIMETYPES[fmt])
+    resp.headers["Content-Disposition"] = f'attachment; filename="issues.{fmt}"'
+    return resp
 
 
 @app.route("/recompute", methods=["POST"])
 def recompute():
     """Recompute issues from the current in-memory trees so UI reflects latest state."""
+    busy = job_busy()
+    if busy is not None:
+        return busy
     try:
         if STATE["left_tree"] is None or STATE["right_tree"] is None:
             return jsonify({"error": "no trees"}), 400
-        STATE["issues"] = compute_issues(STATE["left_tree"], STATE["right_tree"], only=None)
+        recompute_issues()
         STATE["idx"] = min(STATE["idx"], max(0, len(STATE["issues"]) - 1))
+        bump_version()
         kinds = Counter([i["kind"] for i in STATE["issues"]])
         return jsonify({"count": len(STATE["issues"]), "byKind": dict(kinds)})
     except Exception as e:
@@ -467,6 +1248,9 @@ def recompute():
 @app.route("/set_filter", methods=["POST"])
 def set_filter():
     """Recompute issues for a specific kind from current trees, no re-upload required."""
+    busy = job_busy()
+    if busy is not None:
+        return busy
     try:
         if STATE["left_tree"] is None or STATE["right_tree"] is None:
             return jsonify({"error": "no trees"}), 400
@@ -474,10 +1258,11 @@ def set_filter():
         only_kind = d.get("only")
         if only_kind == "all":
             only_kind = None
-        if only_kind not in {"gibberish", "duplicate", "footnote", None}:
+        if only_kind not in ISSUE_KINDS:
             only_kind = None
-        STATE["issues"] = compute_issues(STATE["left_tree"], STATE["right_tree"], only=only_kind)
+        recompute_issues(only_kind)
         STATE["idx"] = 0
+        bump_version()
         kinds = Counter([i["kind"] for i in STATE["issues"]])
         return jsonify({"count": len(STATE["issues"]), "byKind": dict(kinds)})
     except Exception as e:
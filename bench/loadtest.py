@@ -0,0 +1,239 @@
+"""
+End-to-end load test: N simulated reviewers drive the Flask app over HTTP.
+
+    python -m bench.loadtest                          # 10 reviewers, synthetic sessions
+    python -m bench.loadtest -c 25 --loops 5 --size 5000
+    python -m bench.loadtest --script session.json    # replay a recorded session
+    python -m bench.loadtest --server single          # compare server configurations
+
+The app is served in-process by werkzeug on 127.0.0.1 with the in-memory
+review-log store, and output files go to a temporary directory, so the run is
+fully offline. Reports p50/p95/p99 latency and throughput per endpoint.
+
+A session script is a JSON list of operations, replayed by every reviewer:
+
+    [{"op": "render", "type": "all"},
+     {"op": "navigate", "dir": "next"},
+     {"op": "accept"},
+     {"op": "recompute"},
+     {"op": "reject"},
+     {"op": "apply"},
+     {"op": "diff"},
+     {"op": "action", "action": "next", "type": "all"}]
+
+"accept" accepts the issue returned by that reviewer's last render; "diff"
+re-uploads the benchmark documents. "action" is the UI's combined round trip
+(/action); an accept action, too, targets the last rendered issue.
+"""
+import argparse
+import json
+import logging
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.request
+import uuid
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from bench.synth import generate_pair
+from xml_engine.store import MemoryStore
+
+# ---------- sessions ----------
+
+def synthetic_session(steps=40, accept_rate=0.3, issue_type="all", seed=0):
+    """Review-like script: render, then Next or Accept(+Recompute), with an Apply at the end."""
+    rng = random.Random(seed)
+    ops = [{"op": "render", "type": issue_type}]
+    for _ in range(steps):
+        if rng.random() < accept_rate:
+            ops += [{"op": "accept"}, {"op": "recompute"}]
+        elif rng.random() < 0.1:
+            ops += [{"op": "reject"}, {"op": "navigate", "dir": "next_wrap"}]
+        else:
+            ops.append({"op": "navigate", "dir": "next"})
+        ops.append({"op": "render", "type": issue_type})
+    ops.append({"op": "apply"})
+    return ops
+
+def _multipart(fields, files):
+    boundary = uuid.uuid4().hex
+    out = []
+    for name, value in fields.items():
+        out.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"\r\n\r\n{value}\r\n'.encode())
+    for name, (filename, data) in files.items():
+        out.append(f'--{boundary}\r\nContent-Disposition: form-data; name="{name}"; filename="{filename}"\r\n'
+                   f'Content-Type: application/xml\r\n\r\n'.encode() + data + b"\r\n")
+    out.append(f"--{boundary}--\r\n".encode())
+    return b"".join(out), f"multipart/form-data; boundary={boundary}"
+
+class Reviewer:
+    """One simulated user: replays a script, remembering the last rendered issue."""
+    def __init__(self, base, docs, record):
+        self.base, self.docs, self.record = base, docs, record
+        self.current = None
+
+    def call(self, endpoint, method="GET", path=None, body=None, ctype="application/json"):
+        req = urllib.request.Request(self.base + (path or endpoint), data=body, method=method)
+        if body is not None:
+            req.add_header("Content-Type", ctype)
+        t0 = time.perf_counter()
+        status, payload = 0, None
+        try:
+            with urllib.request.urlopen(req, timeout=600) as resp:
+                status, payload = resp.status, resp.read()
+        except urllib.error.HTTPError as e:
+            status, payload = e.code, e.read()
+        except OSError:
+            pass
+        self.record(endpoint, time.perf_counter() - t0, 200 <= status < 400)
+        return payload
+
+    def post_json(self, endpoint, data):
+        return self.call(endpoint, "POST", body=json.dumps(data).encode())
+
+    def run(self, ops):
+        for op in ops:
+            kind = op["op"]
+            if kind == "diff":
+                body, ctype = _multipart({"only": op.get("only", "all")},
+                                         {"original": ("left.xml", self.docs[0]),
+                                          "modified": ("right.xml", self.docs[1])})
+                self.call("/diff", "POST", body=body, ctype=ctype)
+            elif kind == "render":
+                payload = self.call("/render", path=f"/render?type={op.get('type', 'all')}")
+                try:
+                    data = json.loads(payload or b"{}")
+                except ValueError:
+                    data = {}
+                self.current = data if data.get("count") else None
+            elif kind == "navigate":
+                self.post_json("/navigate", {"dir": op.get("dir", "next")})
+            elif kind == "accept":
+                if self.current is None:
+                    continue
+                d = self.current
+                self.post_json("/accept", {
+                    "steps": d["steps"], "steps_right": d.get("steps_right"),
+                    "kind": "attr" if d.get("issue_kind") in ("footnote", "attribute") else d.get("issue_kind"),
+                    "attr": d.get("attr"), "tail": d.get("tail", False), "direction": "right_to_left",
+                })
+            elif kind == "action":
+                body = {"action": op.get("action", "none"), "type": op.get("type", "all")}
+                if body["action"] == "accept":
+                    if self.current is None:
+                        continue
+                    d = self.current
+                    body.update({
+                        "steps": d["steps"], "steps_right": d.get("steps_right"),
+                        "kind": "attr" if d.get("issue_kind") in ("footnote", "attribute") else d.get("issue_kind"),
+                        "attr": d.get("attr"), "tail": d.get("tail", False), "direction": "right_to_left",
+                    })
+                payload = self.post_json("/action", body)
+                try:
+                    data = json.loads(payload or b"{}").get("render") or {}
+                except ValueError:
+                    data = {}
+                self.current = data if data.get("count") else None
+            elif kind in ("recompute", "reject", "apply"):
+                self.call(f"/{kind}", "POST", body=b"{}")
+            else:
+                raise ValueError(f"unknown op {kind!r}")
+
+# ---------- stats ----------
+
+def percentile(sorted_vals, q):
+    if not sorted_vals:
+        return 0.0
+    i = min(len(sorted_vals) - 1, max(0, int(round(q / 100.0 * len(sorted_vals) + 0.5)) - 1))
+    return sorted_vals[i]
+
+def report(samples, errors, wall):
+    print(f"\n{'endpoint':<12}{'n':>7}{'err':>6}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'req/s':>9}")
+    total = 0
+    for ep in sorted(samples):
+        vals = sorted(samples[ep])
+        total += len(vals)
+        print(f"{ep:<12}{len(vals):>7}{errors[ep]:>6}"
+              f"{percentile(vals, 50) * 1000:>10.1f}{percentile(vals, 95) * 1000:>10.1f}"
+              f"{percentile(vals, 99) * 1000:>10.1f}{len(vals) / wall:>9.1f}")
+    print(f"{'total':<12}{total:>7}{sum(errors.values()):>6}{'':>30}{total / wall:>9.1f}")
+    print(f"wall time {wall:.2f}s")
+
+# ---------- server ----------
+
+def start_server(mode):
+    from werkzeug.serving import make_server
+    import app as app_module
+
+    app_module.store = MemoryStore()
+    logging.getLogger("werkzeug").setLevel(logging.WARNING)   # no per-request access log
+    server = make_server("127.0.0.1", 0, app_module.app, threaded=(mode == "threaded"))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("-c", "--concurrency", type=int, default=10, help="simultaneous reviewers")
+    ap.add_argument("--loops", type=int, default=1, help="times each reviewer replays the script")
+    ap.add_argument("--script", help="JSON session script (default: synthetic)")
+    ap.add_argument("--steps", type=int, default=40, help="synthetic session length")
+    ap.add_argument("--accept-rate", type=float, default=0.3)
+    ap.add_argument("--type", default="all", help="issue type the synthetic reviewers filter on")
+    ap.add_argument("--size", type=int, default=2000, help="synthetic document size (paragraphs)")
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--server", choices=("threaded", "single"), default="threaded",
+                    help="werkzeug request handling: thread per request, or one at a time")
+    args = ap.parse_args(argv)
+
+    # keep output/ and mmap work files out of the repository
+    os.chdir(tempfile.mkdtemp(prefix="xmlproof-load-"))
+    server = start_server(args.server)
+    base = f"http://127.0.0.1:{server.server_port}"
+
+    left, right = generate_pair(size=args.size, seed=args.seed)
+    docs = (left.encode("utf-8"), right.encode("utf-8"))
+
+    if args.script:
+        with open(args.script, encoding="utf-8") as f:
+            scripts = [json.load(f)] * args.concurrency
+    else:
+        scripts = [synthetic_session(args.steps, args.accept_rate, args.type, seed=args.seed + i)
+                   for i in range(args.concurrency)]
+
+    samples, errors = defaultdict(list), defaultdict(int)
+    lock = threading.Lock()
+
+    def record(endpoint, dt, ok):
+        with lock:
+            samples[endpoint].append(dt)
+            if not ok:
+                errors[endpoint] += 1
+
+    def worker(i):
+        r = Reviewer(base, docs, record)
+        for _ in range(args.loops):
+            r.run(scripts[i])
+
+    t0 = time.perf_counter()
+    # Shared setup: the app holds one review session, so upload the pair once
+    Reviewer(base, docs, record).run([{"op": "diff"}])
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(args.concurrency)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    wall = time.perf_counter() - t0
+
+    server.shutdown()
+    report(samples, errors, wall)
+    return 1 if sum(errors.values()) else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
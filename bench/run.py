@@ -0,0 +1,170 @@
+"""
+Micro-benchmarks for the xml_engine hot paths.
+
+    python -m bench.run                      # run, compare to bench/baseline.json
+    python -m bench.run --save               # run and overwrite the baseline
+    python -m bench.run --sizes 500 2000 --threshold 0.5 --only parse_tree
+
+Each benchmark is timed `--repeat` times per size and the best run is kept.
+A result is a regression when it is slower than the baseline by more than the
+threshold (a fraction: 0.25 = 25%). Per-benchmark thresholds can be stored in
+the baseline file under "thresholds". Exit code 1 if anything regressed or has
+no baseline yet (refresh it with --save).
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from xml_engine.diff import (
+    parse_tree, compute_gibberish_issues, compute_footnote_issues, compute_attribute_issues,
+    compute_duplicate_issues, compute_issues,
+)
+from xml_engine.hardindex import (
+    index_element_text_spans, index_attribute_value_spans, apply_replacements, TAIL,
+)
+from xml_engine.utils import token_diff_html, render_full_tree_with_injected
+from xml_engine import tokens
+from bench.synth import generate_pair
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+DEFAULT_SIZES = (500, 2000, 8000)
+# Differences below this are timer noise, never regressions
+NOISE_FLOOR = 0.002
+
+def _best(fn, repeat):
+    best = None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        dt = time.perf_counter() - t0
+        best = dt if best is None else min(best, dt)
+    return best
+
+def benchmarks(left, right):
+    """name -> zero-arg callable, all sharing one prepared document pair."""
+    lt, rt = parse_tree(left), parse_tree(right)
+    spans = [span for key, span in index_element_text_spans(left).items() if not key.endswith(TAIL)]
+    # every 10th element text span replaced with itself upper-cased
+    reps = [(s, e, left[s:e].upper()) for i, (s, e) in enumerate(spans) if i % 10 == 0]
+    issues = compute_gibberish_issues(lt, rt) + compute_duplicate_issues(lt, rt)
+    pairs = [(d["old"], d["new"]) for d in issues] or [("", "")]
+    target = issues[0]["steps"] if issues else ((lt.getroot().tag, 1),)
+
+    def cold(compute):
+        # detection fills the trees' token caches: drop them so every repeat
+        # tokenizes again, as the first scan of an upload does
+        def fn():
+            tokens.forget(lt)
+            tokens.forget(rt)
+            return compute(lt, rt)
+        return fn
+
+    return {
+        "parse_tree":                     lambda: parse_tree(left),
+        "compute_gibberish_issues":       cold(compute_gibberish_issues),
+        "compute_footnote_issues":        cold(compute_footnote_issues),
+        "compute_attribute_issues":       cold(compute_attribute_issues),
+        "compute_duplicate_issues":       cold(compute_duplicate_issues),
+        "compute_issues":                 cold(compute_issues),
+        # rescan with the token caches already filled (after an /accept)
+        "compute_issues_warm":            lambda: compute_issues(lt, rt),
+        "index_element_text_spans":       lambda: index_element_text_spans(left),
+        "index_attribute_value_spans":    lambda: index_attribute_value_spans(left),
+        "apply_replacements":             lambda: apply_replacements(left, reps),
+        "token_diff_html":                lambda: [token_diff_html(a, b) for a, b in pairs],
+        "render_full_tree_with_injected": lambda: render_full_tree_with_injected(
+            lt.getroot(), target, "<b>x</b>", kind="text"),
+    }
+
+def run(sizes, repeat, only=None, doc_opts=None):
+    results = {}
+    for size in sizes:
+        left, right = generate_pair(size=size, **(doc_opts or {}))
+        for name, fn in benchmarks(left, right).items():
+            if only and name not in only:
+                continue
+            key = f"{name}[{size}]"
+            results[key] = _best(fn, repeat)
+            print(f"{key:<45} {results[key] * 1000:10.2f} ms", flush=True)
+    return results
+
+def missing_baselines(results, baseline):
+    """Benchmarks that ran but have no baseline number, so compare() can't gate them."""
+    known = baseline.get("results", {})
+    return [key for key in results if key not in known]
+
+def compare(results, baseline, threshold):
+    """Return [(key, base, now, allowed)] for results slower than their threshold."""
+    thresholds = baseline.get("thresholds", {})
+    regressions = []
+    for key, now in results.items():
+        base = baseline.get("results", {}).get(key)
+        if base is None:
+            continue
+        allowed = thresholds.get(key, thresholds.get(key.split("[", 1)[0], threshold))
+        if now - base > NOISE_FLOOR and now > base * (1 + allowed):
+            regressions.append((key, base, now, allowed))
+    return regressions
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", type=int, nargs="+", default=list(DEFAULT_SIZES), help="paragraph counts")
+    ap.add_argument("--repeat", type=int, default=3)
+    ap.add_argument("--only", nargs="+", help="benchmark names to run")
+    ap.add_argument("--baseline", default=BASELINE)
+    ap.add_argument("--threshold", type=float, default=0.25, help="default allowed slowdown fraction")
+    ap.add_argument("--save", action="store_true", help="write results as the new baseline")
+    # synthetic document shape
+    ap.add_argument("--depth", type=int, default=3)
+    ap.add_argument("--ns-prefix", default=None)
+    ap.add_argument("--footnote-density", type=float, default=0.05)
+    ap.add_argument("--gibberish-rate", type=float, default=0.02)
+    ap.add_argument("--duplicate-rate", type=float, default=0.02)
+    ap.add_argument("--seed", type=int, default=0)
+    args = ap.parse_args(argv)
+
+    doc_opts = {
+        "depth": args.depth, "ns_prefix": args.ns_prefix,
+        "footnote_density": args.footnote_density, "gibberish_rate": args.gibberish_rate,
+        "duplicate_rate": args.duplicate_rate, "seed": args.seed,
+    }
+    results = run(args.sizes, args.repeat, args.only, doc_opts)
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+
+    if args.save:
+        # keep hand-tuned thresholds when refreshing the numbers
+        out = {"doc": doc_opts, "thresholds": baseline.get("thresholds", {}),
+               "results": {**baseline.get("results", {}), **results}}
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(out, f, indent=2, sort_keys=True)
+            f.write("\n")
+        print(f"baseline written to {args.baseline}")
+        return 0
+
+    if not baseline:
+        print("no baseline to compare against (run with --save)")
+        return 0
+    if baseline.get("doc") and baseline["doc"] != doc_opts:
+        print("warning: document options differ from the baseline's", baseline["doc"])
+
+    regressions = compare(results, baseline, args.threshold)
+    for key, base, now, allowed in regressions:
+        print(f"REGRESSION {key}: {base * 1000:.2f} ms -> {now * 1000:.2f} ms "
+              f"(+{(now / base - 1) * 100:.0f}%, allowed +{allowed * 100:.0f}%)")
+    missing = missing_baselines(results, baseline)
+    for key in missing:
+        print(f"NO BASELINE {key} (run with --save)")
+    if not regressions and not missing:
+        print("no regressions")
+    return 1 if regressions or missing else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
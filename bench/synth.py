@@ -0,0 +1,105 @@
+"""
+Deterministic synthetic document pairs for benchmarks.
+
+generate_pair() returns (left_xml, right_xml) shaped like the app's inputs:
+RIGHT is the clean "versioning" source, LEFT is the "input" copy with defects
+injected at the requested rates (gibberish text, duplicated words, footnote
+attribute drift). Same arguments + seed -> byte-identical output.
+"""
+import random
+from typing import Optional, Tuple
+
+WORDS = (
+    "the river ran past old stone walls while children gathered near market "
+    "square and merchants called their prices across narrow streets under "
+    "autumn light that fell softly upon roofs gardens bridges and quiet houses "
+    "where families shared bread stories songs letters memories and hopes"
+).split()
+
+CONTAINERS = ("part", "chapter", "section", "subsection", "div")
+
+def _sentence(rng: random.Random, lo: int = 6, hi: int = 18) -> str:
+    words = [rng.choice(WORDS) for _ in range(rng.randint(lo, hi))]
+    words[0] = words[0].capitalize()
+    return " ".join(words) + "."
+
+def _gibberish(rng: random.Random) -> str:
+    consonants = "bcdfghjklmnpqrstvwxz"
+    return "".join(rng.choice(consonants) for _ in range(rng.randint(8, 14))).upper() + " " + _sentence(rng, 2, 5)
+
+def _duplicated(rng: random.Random, text: str) -> str:
+    words = text.split()
+    i = rng.randrange(len(words))
+    return " ".join(words[:i + 1] + [words[i]] + words[i:])
+
+def generate_pair(
+    size: int = 1000,
+    depth: int = 3,
+    ns_prefix: Optional[str] = None,
+    footnote_density: float = 0.05,
+    gibberish_rate: float = 0.02,
+    duplicate_rate: float = 0.02,
+    seed: int = 0,
+) -> Tuple[str, str]:
+    """
+    size:             number of paragraph blocks
+    depth:            container nesting levels between the root and the paragraphs
+    ns_prefix:        if set, elements and footnote attributes use this namespace prefix
+    footnote_density: probability a paragraph is followed by a <footnote>
+    gibberish_rate:   probability a LEFT paragraph is replaced by gibberish
+    duplicate_rate:   probability a LEFT paragraph gets a repeated word
+    """
+    rng = random.Random(seed)
+    p = f"{ns_prefix}:" if ns_prefix else ""
+    ns_decl = f' xmlns:{ns_prefix}="urn:bench:{ns_prefix}"' if ns_prefix else ""
+    # Fan-out per container level so the paragraph count lands near `size`
+    fanout = max(2, round(size ** (1.0 / (depth + 1)))) if depth else size
+
+    left, right = [], []
+    counter = {"para": 0, "fn": 0}
+
+    def emit(s, t=None):
+        left.append(s)
+        right.append(s if t is None else t)
+
+    def paragraphs(n):
+        for _ in range(n):
+            if counter["para"] >= size:
+                return
+            counter["para"] += 1
+            text = _sentence(rng)
+            roll = rng.random()
+            if roll < gibberish_rate:
+                ltext = _gibberish(rng)
+            elif roll < gibberish_rate + duplicate_rate:
+                ltext = _duplicated(rng, text)
+            else:
+                ltext = text
+            emit(f"<{p}para>{ltext}</{p}para>", f"<{p}para>{text}</{p}para>")
+            if rng.random() < footnote_density:
+                counter["fn"] += 1
+                n_fn = counter["fn"]
+                # footnote attributes drift on the LEFT at the gibberish rate x 10
+                lid = f"fn{n_fn + 1}" if rng.random() < min(1.0, gibberish_rate * 10) else f"fn{n_fn}"
+                body = _sentence(rng, 3, 8)
+                emit(f'<{p}footnote id="{lid}" {p}label="{n_fn}">{body}</{p}footnote>',
+                     f'<{p}footnote id="fn{n_fn}" {p}label="{n_fn}">{body}</{p}footnote>')
+
+    def container(level):
+        if level == depth:
+            paragraphs(fanout)
+            return
+        tag = CONTAINERS[level % len(CONTAINERS)]
+        for i in range(fanout):
+            if counter["para"] >= size:
+                return
+            emit(f"<{p}{tag}>")
+            emit(f"<{p}title>{_sentence(rng, 2, 6)}</{p}title>")
+            container(level + 1)
+            emit(f"</{p}{tag}>")
+
+    emit(f'<?xml version="1.0" encoding="UTF-8"?>\n<{p}book{ns_decl}>')
+    while counter["para"] < size:
+        container(0)
+    emit(f"</{p}book>")
+    return "\n".join(left), "\n".join(right)
@@ -3,9 +3,11 @@ let currentSteps = null;
 let currentStepsRight = null;
 let currentKind  = "text";
 let currentAttr  = null;
+let currentTail  = false;   // issue is in the text after the element (mixed content)
 let currentDirection = "right_to_left"; 
 let currentIssueKind = "gibberish";
 let hasDiff = false;
+let currentJob = null;   // id of the running /diff job, if any
 
 let programmaticScroll = false;
 function withProgrammaticScroll(fn, unlockDelay = 160) {
@@ -64,7 +66,11 @@ async function loadCurrent() {
     alert("Render failed: " + t);
     return;
   }
-  const data = await r.json();
+  showRender(await r.json());
+}
+
+// Paint one /render payload (also the "render" part of an /action response)
+function showRender(data) {
   if (data) console.log("RENDER →", data);
 
   const leftPane  = document.getElementById("leftPane");
@@ -78,6 +84,7 @@ async function loadCurrent() {
     currentStepsRight = null;
     currentKind  = "text";
     currentAttr  = null;
+    currentTail  = false;
     currentIssueKind = "gibberish";
     currentDirection = "right_to_left";
     return;
@@ -92,8 +99,9 @@ async function loadCurrent() {
   currentSteps       = data.steps || null;
   currentStepsRight  = data.steps_right || null;
   currentKind        = data.kind || "text";                 // "text" | "attr" (for rendering)
-  currentIssueKind   = data.issue_kind || "gibberish";      // real kind: "duplicate" | "gibberish" | "footnote"
+  currentIssueKind   = data.issue_kind || "gibberish";      // real kind: "duplicate" | "gibberish" | "footnote" | "attribute"
   currentAttr        = data.attr || null;
+  currentTail        = !!data.tail;
 
   // Always treat RIGHT as the correct source → copy right → left
   currentDirection = "right_to_left";
@@ -129,18 +137,32 @@ async function runDiff(kind) {
     form.append("only", "all");
   }
 
+  // Run as a background job so large books don't time out; review starts with the first issue
+  form.append("mode", "job");
+
+  if (currentJob) {
+    try { await fetch(`/jobs/${currentJob}/cancel`, { method: "POST" }); } catch {}
+  }
+
   const res = await fetch("/diff", { method: "POST", body: form });
   if (!res.ok) {
     const msg = await res.text();
     alert("Compare failed: " + msg);
     return;
   }
-  const info = await res.json();
+  let info = await res.json();
   if (info) console.log("DIFF →", info);
   hasDiff = true;
+  if (kind) document.getElementById("issueType").value = kind;
+
+  if (info.job) {
+    info = await pollJob(info.job);
+    if (!info) return;
+  }
 
   const pretty = (k) =>
     k === "footnote" ? "footnote attrs" :
+    k === "attribute" ? "attribute" :
     k === "duplicate" ? "duplicate" :
     k === "gibberish" ? "gibberish" : "any";
 
@@ -149,14 +171,42 @@ async function runDiff(kind) {
     document.getElementById("leftPane").textContent  = "";
     document.getElementById("rightPane").textContent = "";
     document.getElementById("pos").textContent = "0/0";
-    currentSteps = null; currentStepsRight = null; currentKind = "text"; currentAttr = null;
+    currentSteps = null; currentStepsRight = null; currentKind = "text"; currentAttr = null; currentTail = false;
     return;
   }
 
-  if (kind) document.getElementById("issueType").value = kind;
   await loadCurrent();
 }
 
+// Poll a /diff job until it finishes; render as soon as the first issue arrives
+async function pollJob(jobId) {
+  currentJob = jobId;
+  let shown = false;
+  while (currentJob === jobId) {
+    const r = await fetch(`/jobs/${jobId}`);
+    if (!r.ok) { currentJob = null; alert("Compare failed: " + await r.text()); return null; }
+    const job = await r.json();
+    console.log("JOB →", job);
+
+    if (job.status === "error") { currentJob = null; alert("Compare failed: " + job.error); return null; }
+    if (job.status === "cancelled") { currentJob = null; return null; }
+    if (job.status === "done") { currentJob = null; return { count: job.found, byKind: job.byKind }; }
+
+    // Once detection starts the issue list is lazy: /render pulls the first issue itself
+    if (!shown && job.stage === "detect") {
+      shown = true;
+      await loadCurrent();
+    } else if (shown) {
+      const type  = document.getElementById("issueType").value;
+      const count = type === "all" ? job.found : (job.byKind[type] || 0);
+      const pos   = document.getElementById("pos");
+      pos.textContent = pos.textContent.replace(/\/.*$/, `/${count}…`);
+    }
+    await new Promise((res) => setTimeout(res, 300));
+  }
+  return null;
+}
+
 // ======= UI wiring =======
 document.getElementById("issueType").addEventListener("change", async (e) => {
   const v = e.target.value;
@@ -164,7 +214,7 @@ document.getElementById("issueType").addEventListener("change", async (e) => {
     document.getElementById("leftPane").textContent  = "";
     document.getElementById("rightPane").textContent = "";
     document.getElementById("pos").textContent = "0/0";
-    currentSteps = null; currentStepsRight = null; currentKind = "text"; currentAttr = null;
+    currentSteps = null; currentStepsRight = null; currentKind = "text"; currentAttr = null; currentTail = false;
     return;
   }
   // If we haven't compared yet, run initial diff once. Otherwise just re-render with new filter.
@@ -178,42 +228,47 @@ document.getElementById("issueType").addEventListener("change", async (e) => {
 });
 
 // ======= Navigation & actions =======
-document.getElementById("nextBtn").onclick = async () => {
-  await fetch("/navigate", { method: "POST", headers: { "Content-Type": "application/json" }, body: JSON.stringify({ dir: "next" }) });
-  await loadCurrent();
-};
+// One round trip per click: the server performs the action and answers with the
+// new current issue already rendered (the next one is prefetched server-side)
+async function doAction(action, extra = {}) {
+  const issueType = document.getElementById("issueType").value || "gibberish";
+  const r = await fetch("/action", {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify({ action, type: issueType, ...extra })
+  });
+  let data = null;
+  try { data = await r.json(); } catch {}
+  if (!data || !data.render) {
+    alert(`${action} failed` + (data && data.error ? ": " + data.error : ""));
+    return;
+  }
+  if (data) console.log("ACTION →", data.action, data.result, data.stats);
+  showRender(data.render);
+}
 
-document.getElementById("prevBtn").onclick = async () => {
-  await fetch("/navigate", { method: "POST", headers: { "Content-Type": "application/json" }, body: JSON.stringify({ dir: "prev" }) });
-  await loadCurrent();
-};
+document.getElementById("nextBtn").onclick = () => doAction("next");
+document.getElementById("prevBtn").onclick = () => doAction("prev");
 
-// Accept click
+// Accept click (the server recomputes issues as part of the accept)
 document.getElementById("acceptBtn").onclick = async () => {
   if (!currentSteps) return;
-  const sendKind = (currentIssueKind === "footnote") ? "attr" : currentIssueKind;
-  await fetch("/accept", {
-    method: "POST",
-    headers: { "Content-Type": "application/json" },
-    body: JSON.stringify({
-      steps: currentSteps,
-      steps_right: currentStepsRight,
-      kind: sendKind,
-      attr: currentAttr,
-      direction: currentDirection
-    })
+  const sendKind = (currentIssueKind === "footnote" || currentIssueKind === "attribute") ? "attr" : currentIssueKind;
+  await doAction("accept", {
+    steps: currentSteps,
+    steps_right: currentStepsRight,
+    kind: sendKind,
+    attr: currentAttr,
+    tail: currentTail,
+    direction: currentDirection
   });
-  // Always recompute issues to reflect any structural changes and refresh panes
-  try { await fetch("/recompute", { method: "POST" }); } catch {}
-  await loadCurrent();
 };
 
-document.getElementById("rejectBtn").onclick = async () => {
-  await fetch("/reject", { method: "POST", headers: { "Content-Type": "application/json" }, body: JSON.stringify({}) });
-  // After reject, wrap to next item (1 after last becomes 1)
-  await fetch("/navigate", { method: "POST", headers: { "Content-Type": "application/json" }, body: JSON.stringify({ dir: "next_wrap" }) });
-  await loadCurrent();
-};
+// After reject, wrap to next item (1 after last becomes 1)
+document.getElementById("rejectBtn").onclick = () => doAction("reject");
+
+document.getElementById("undoBtn").onclick = () => doAction("undo");
+document.getElementById("redoBtn").onclick = () => doAction("redo");
 
 document.getElementById("applyBtn").onclick = async () => {
   const r = await fetch("/apply", {
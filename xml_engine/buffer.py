@@ -0,0 +1,91 @@
+import hashlib
+import mmap
+import os
+import shutil
+from typing import List, Tuple, Union
+
+class MappedDocument:
+    """
+    A raw XML document kept as a UTF-8 file and read through mmap.
+    Offsets (span indexes, slices, replacements) are BYTE offsets into the file,
+    so the text never has to live in the process as a Python str.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._digest = None
+        self._open()
+
+    def _open(self):
+        self._file = open(self.path, "rb")
+        size = os.fstat(self._file.fileno()).st_size
+        # mmap can't map an empty file
+        self.buf = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b""
+
+    @classmethod
+    def from_bytes(cls, path: str, data: bytes) -> "MappedDocument":
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp = path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(data)
+        # Atomic swap: a mapping of the previous file stays valid until it is closed
+        os.replace(tmp, path)
+        return cls(path)
+
+    @classmethod
+    def from_text(cls, path: str, text: str) -> "MappedDocument":
+        return cls.from_bytes(path, text.encode("utf-8", errors="replace"))
+
+    def __len__(self) -> int:
+        return len(self.buf)
+
+    def __getitem__(self, key) -> bytes:
+        return self.buf[key]
+
+    @property
+    def digest(self) -> str:
+        if self._digest is None:
+            self._digest = hashlib.sha1(self.buf).hexdigest()
+        return self._digest
+
+    def matches(self, text: str) -> bool:
+        """True if `text` (as UTF-8) is exactly this document."""
+        data = text.encode("utf-8", errors="replace")
+        return len(data) == len(self.buf) and hashlib.sha1(data).hexdigest() == self.digest
+
+    def text(self) -> str:
+        return self.buf[:].decode("utf-8", errors="replace")
+
+    def apply(self, replacements: List[Tuple[int, int, Union[bytes, str]]]) -> "MappedDocument":
+        """
+        Apply (start, end, replacement) byte-offset chunks by streaming the file into a
+        new copy and remapping it. Overlapping or out-of-range chunks are skipped.
+        """
+        if not replacements:
+            return self
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as f, memoryview(self.buf) as mv:
+            pos = 0
+            for s, e, rep in sorted(replacements, key=lambda x: x[0]):
+                if not (pos <= s <= e <= len(mv)):
+                    continue
+                f.write(mv[pos:s])
+                f.write(rep.encode("utf-8", errors="replace") if isinstance(rep, str) else rep)
+                pos = e
+            f.write(mv[pos:])
+        self.close()
+        os.replace(tmp, self.path)
+        self._digest = None
+        self._open()
+        return self
+
+    def copy_to(self, path: str):
+        shutil.copyfile(self.path, path)
+
+    def close(self):
+        if isinstance(self.buf, mmap.mmap):
+            self.buf.close()
+        self._file.close()
+
+def buffer_of(xml):
+    """What regex scanners should run over: the str itself, or a document's mapping."""
+    return xml.buf if isinstance(xml, MappedDocument) else xml
@@ -1,44 +1,46 @@
 # diff.py
 from lxml import etree as LET
-from .normalize import preprocess_xml, normalize_text_for_diff
+from .normalize import preprocess_xml, preprocess_xml_bytes, normalize_text_for_diff
+from .buffer import MappedDocument
 from .utils import build_path, local_name
+from .hardindex import build_path_key, TAIL
+from .tokens import TextTokens, cache_for
+import csv
+import json
 import re
+import threading
 from collections import Counter
-from typing import Optional
+from typing import Iterable, Iterator, Optional
 
 # duplicate 
-WORD_RE = re.compile(r"[^\W\d_]+(?:['’][^\W\d_]+)?", re.UNICODE)
-
-def _token_spans(s: str):
-    return [(m.group(0), m.start(), m.end()) for m in WORD_RE.finditer(s or "")]
-
-def _key(w: str) -> str:
-    return (w or "").casefold()
-
-def _highlight_tokens(text: str, keys: set[str]) -> Optional[str]:
-    """Highlight ALL occurrences of any key in `keys`."""
-    if not text or not keys:
-        return None
-    toks = _token_spans(text)
-    if not toks:
+def _highlight_tokens(t: TextTokens, keys: set[str]) -> Optional[str]:
+    """Highlight ALL occurrences of any key in `keys` in the cached text `t`."""
+    text = t.text
+    if not text or not keys or not t.words:
         return None
     out, last, hit = [], 0, False
-    for w, s, e in toks:
+    for (w, s, e), k in zip(t.words, t.keys):
         out.append(text[last:s])
-        if _key(w) in keys:
+        if k in keys:
             out.append(f'<span class="editNewInline">{w}</span>')
             hit = True
         else:
             out.append(w)
         last = e
     out.append(text[last:])
-    return "".join(out) if hit else None
+    # words never include whitespace, so this equals highlighting the stripped text
+    return "".join(out).strip() if hit else None
 
 # duplicate 
 
-def parse_tree(xml_string: str) -> LET.ElementTree:
+def parse_tree(xml_string) -> LET.ElementTree:
+    """xml_string: str, or a MappedDocument (parsed straight from its UTF-8 mapping)."""
     parser = LET.XMLParser(recover=True, remove_blank_text=False)
-    root = LET.fromstring(preprocess_xml(xml_string).encode("utf-8"), parser=parser)
+    if isinstance(xml_string, MappedDocument):
+        data = preprocess_xml_bytes(xml_string.buf)
+    else:
+        data = preprocess_xml(xml_string).encode("utf-8")
+    root = LET.fromstring(data, parser=parser)
     return LET.ElementTree(root)
 
 def looks_gibberish(s: str) -> bool:
@@ -87,105 +89,362 @@ def looks_gibberish(s: str) -> bool:
 #             print(issues)
 #     return issues
 
-# ---------- fast, kind-specific scanners ----------
+# ---------- detection rules ----------
 _FOOTNOTE_TAGS = {"footnote", "fn", "footnote-ref", "fn-ref"}
+_TEXT_BLOCKS = ("para", "p", "title", "entry-title")
 
-def compute_gibberish_issues(left_tree, right_tree):
-    out = []
+# Which checks run on an aligned element pair, by the element's local name.
+# "*" is used for every name without an entry of its own; within an element the
+# checks run (and report) in the listed order. See configure_rules().
+_DEFAULT = ("gibberish", "attributes", "tail_gibberish", "tail_duplicate")
+_BLOCK = ("gibberish", "attributes", "duplicate", "tail_gibberish", "tail_duplicate")
+_NOTE = ("gibberish", "footnote", "tail_gibberish", "tail_duplicate")
+DEFAULT_RULES = {
+    "*": _DEFAULT,
+    **{name: _BLOCK for name in _TEXT_BLOCKS},
+    **{name: _NOTE for name in _FOOTNOTE_TAGS},
+}
+RULES = dict(DEFAULT_RULES)
+
+# How many aligned pairs to scan between progress callbacks
+PROGRESS_EVERY = 500
+
+def _aligned_pairs(left_tree, right_tree, progress=None, stop=None):
+    """
+    Yield (left, right) element pairs in document order.
+    If given, progress(scanned=n) is called every PROGRESS_EVERY pairs and at the end.
+    stop: optional threading.Event, checked every PROGRESS_EVERY pairs; once set the
+    scan ends there (job cancellation), even if no issue has been found meanwhile.
+    """
     L = (e for e in left_tree.getroot().iter()  if isinstance(e.tag, str))
     R = (e for e in right_tree.getroot().iter() if isinstance(e.tag, str))
-    for l_elem, r_elem in zip(L, R):
-        if local_name(l_elem.tag) != local_name(r_elem.tag): 
-            continue
-        lt = l_elem.text or ""
-        rt = r_elem.text or ""
-        if looks_gibberish(lt) and lt != rt:
-            print({"kind": "gibberish", "steps": build_path(l_elem), "old": lt, "new": rt})
-            out.append({"kind": "gibberish", "steps": build_path(l_elem), "old": lt, "new": rt})
-            print(out)
-    return out
+    if progress is None and stop is None:
+        yield from zip(L, R)
+        return
+    n = 0
+    for pair in zip(L, R):
+        yield pair
+        n += 1
+        if n == PROGRESS_EVERY:
+            if progress is not None:
+                progress(scanned=n)
+            n = 0
+            if stop is not None and stop.is_set():
+                return
+    if progress is not None:
+        progress(scanned=n)
 
+def aligned_pair_of(left_tree, right_tree, elem):
+    """
+    The (left, right) pair that contains `elem` (an element of either tree), as
+    _aligned_pairs pairs them, i.e. by position, not by path. None if unpaired.
+    """
+    for l, r in _aligned_pairs(left_tree, right_tree):
+        if l is elem or r is elem:
+            return l, r
+    return None
 
+# Per-element checks: each gets an aligned (left, right) pair with matching local
+# names, plus the two documents' token caches, and yields the issues found on it.
 
-def compute_footnote_issues(left_tree, right_tree):
-    out = []
-    L = (e for e in left_tree.getroot().iter()  if isinstance(e.tag, str))
-    R = (e for e in right_tree.getroot().iter() if isinstance(e.tag, str))
-    for l_elem, r_elem in zip(L, R):
-        if local_name(l_elem.tag) != local_name(r_elem.tag):
-            continue
-        if local_name(l_elem.tag) not in _FOOTNOTE_TAGS:
-            continue
-        l_attrs = {k.split(":")[-1]: v for k, v in l_elem.attrib.items()}
-        r_attrs = {k.split(":")[-1]: v for k, v in r_elem.attrib.items()}
-        for k in (set(l_attrs) | set(r_attrs)):
-            lv, rv = l_attrs.get(k, ""), r_attrs.get(k, "")
-            if lv != rv:
-                out.append({
-                    "kind": "footnote",
-                    "steps": build_path(l_elem),
-                    "steps_right": build_path(r_elem),
-                    "attr": k,
-                    "old": lv,
-                    "new": rv
-                })
-    
+def _gibberish_at(l_elem, r_elem, tokens):
+    lt = l_elem.text or ""
+    rt = r_elem.text or ""
+    if looks_gibberish(lt) and lt != rt:
+        yield {"kind": "gibberish", "steps": build_path(l_elem), "old": lt, "new": rt}
+
+def _tail_gibberish_at(l_elem, r_elem, tokens):
+    """Gibberish in the text after the element (mixed content), reported on the element."""
+    lt = l_elem.tail or ""
+    rt = r_elem.tail or ""
+    if looks_gibberish(lt) and lt != rt:
+        yield {"kind": "gibberish", "steps": build_path(l_elem), "steps_right": build_path(r_elem),
+               "tail": True, "old": lt, "new": rt}
+
+# attribute key as lxml reports it ("{uri}label", "label") -> local name
+_ATTR_LOCAL = {}
+
+def _attr_map(elem):
+    """{local name: value} for elem's attributes; key -> local name lookups are cached."""
+    out = {}
+    for k, v in elem.attrib.items():
+        ln = _ATTR_LOCAL.get(k)
+        if ln is None:
+            ln = _ATTR_LOCAL[k] = local_name(k)
+        out[ln] = v
     return out
 
-def compute_duplicate_issues(left_tree, right_tree):
+def _attr_issues(l_elem, r_elem, kind):
+    la, ra = l_elem.attrib, r_elem.attrib
+    if not la and not ra:
+        return
+    if len(la) == len(ra) and all(ra.get(k) == v for k, v in la.items()):
+        return   # identical keys and values: skip building the maps
+    l_attrs, r_attrs = _attr_map(l_elem), _attr_map(r_elem)
+    for k in (set(l_attrs) | set(r_attrs)):
+        lv, rv = l_attrs.get(k, ""), r_attrs.get(k, "")
+        if lv != rv:
+            yield {
+                "kind": kind,
+                "steps": build_path(l_elem),
+                "steps_right": build_path(r_elem),
+                "attr": k,
+                "old": lv,
+                "new": rv
+            }
+
+def _footnote_at(l_elem, r_elem, tokens):
+    return _attr_issues(l_elem, r_elem, "footnote")
+
+def _attributes_at(l_elem, r_elem, tokens):
+    return _attr_issues(l_elem, r_elem, "attribute")
+
+def _repeated_words(lt: TextTokens, rt: TextTokens):
     """
-    Compare aligned elements.
     If a word appears >=2 times on one side and more than on the other side,
-    highlight ALL its occurrences on that side.
+    highlight ALL its occurrences on that side: (left_html, right_html), or None.
     """
-    issues = []
-    L = (e for e in left_tree.getroot().iter()  if isinstance(e.tag, str))
-    R = (e for e in right_tree.getroot().iter() if isinstance(e.tag, str))
+    # counts (case-insensitive)
+    lc, rc = lt.counts, rt.counts
 
-    for l_elem, r_elem in zip(L, R):
-        if local_name(l_elem.tag) != local_name(r_elem.tag):
-            continue
-        if local_name(l_elem.tag) not in ("para", "p", "title", "entry-title"):
-            continue
-
-        lt = (l_elem.text or "").strip()
-        rt = (r_elem.text or "").strip()
-        if not lt and not rt:
-            continue
-
-        # counts (case-insensitive)
-        lc = Counter(_key(w) for w,_,_ in _token_spans(lt))
-        rc = Counter(_key(w) for w,_,_ in _token_spans(rt))
-
-        # words to highlight on each side
-        right_keys = {k for k, c in rc.items() if c >= 2 and c > lc.get(k, 0)}
-        left_keys  = {k for k, c in lc.items() if c >= 2 and c > rc.get(k, 0)}
-
-        right_high = _highlight_tokens(rt, right_keys) if right_keys else None
-        left_high  = _highlight_tokens(lt, left_keys)  if left_keys  else None
-
-        if right_high or left_high:
-            issues.append({
-                "kind": "duplicate",
-                "steps": build_path(l_elem),           # keep LEFT steps for /apply
-                "steps_right": build_path(r_elem),     # right steps for render
-                "old": lt,
-                "new": rt,
-                "right_highlight": right_high,
-                "left_highlight": left_high,
-            })
-    return issues
-
-def compute_issues(left_tree, right_tree, only=None):
-    if only == "gibberish":
-        return compute_gibberish_issues(left_tree, right_tree)
-    if only == "duplicate":
-        return compute_duplicate_issues(left_tree, right_tree)   # <-- changed
-    if only == "footnote":
-        return compute_footnote_issues(left_tree, right_tree)
-
-    out = []
-    out += compute_gibberish_issues(left_tree, right_tree)
-    out += compute_footnote_issues(left_tree, right_tree)
-    out += compute_duplicate_issues(left_tree, right_tree)       # <-- changed
-    return out
+    # words to highlight on each side
+    right_keys = {k for k, c in rc.items() if c >= 2 and c > lc.get(k, 0)}
+    left_keys  = {k for k, c in lc.items() if c >= 2 and c > rc.get(k, 0)}
+
+    right_high = _highlight_tokens(rt, right_keys) if right_keys else None
+    left_high  = _highlight_tokens(lt, left_keys)  if left_keys  else None
+    if right_high or left_high:
+        return left_high, right_high
+    return None
+
+def _duplicate_at(l_elem, r_elem, tokens):
+    lt = (l_elem.text or "").strip()
+    rt = (r_elem.text or "").strip()
+    if not lt and not rt:
+        return
+    found = _repeated_words(tokens[0].get(l_elem), tokens[1].get(r_elem))
+    if found:
+        yield {
+            "kind": "duplicate",
+            "steps": build_path(l_elem),           # keep LEFT steps for /apply
+            "steps_right": build_path(r_elem),     # right steps for render
+            "old": lt,
+            "new": rt,
+            "right_highlight": found[1],
+            "left_highlight": found[0],
+        }
+
+def _tail_duplicate_at(l_elem, r_elem, tokens):
+    lt = (l_elem.tail or "").strip()
+    rt = (r_elem.tail or "").strip()
+    if not lt and not rt:
+        return
+    found = _repeated_words(tokens[0].get(l_elem, "tail"), tokens[1].get(r_elem, "tail"))
+    if found:
+        yield {
+            "kind": "duplicate",
+            "steps": build_path(l_elem),
+            "steps_right": build_path(r_elem),
+            "tail": True,
+            "old": lt,
+            "new": rt,
+            "right_highlight": found[1],
+            "left_highlight": found[0],
+        }
+
+# check name (as used in RULES) -> (issue kind it reports, check)
+_CHECKS = {
+    "gibberish":      ("gibberish", _gibberish_at),
+    "tail_gibberish": ("gibberish", _tail_gibberish_at),
+    "footnote":       ("footnote",  _footnote_at),
+    "attributes":     ("attribute", _attributes_at),
+    "duplicate":      ("duplicate", _duplicate_at),
+    "tail_duplicate": ("duplicate", _tail_duplicate_at),
+}
+ISSUE_KINDS = ("gibberish", "footnote", "attribute", "duplicate")
+
+# (only, local name) -> tuple of checks; filled on first sight of each name
+_PLANS = {}
+
+def configure_rules(rules=None):
+    """
+    Replace the rule table ({local name or "*": [check names]}); None restores the
+    defaults. Unknown check names raise ValueError.
+    """
+    rules = dict(DEFAULT_RULES if rules is None else rules)
+    rules.setdefault("*", ())
+    for name, checks in rules.items():
+        unknown = [c for c in checks if c not in _CHECKS]
+        if unknown:
+            raise ValueError(f"rule {name!r}: unknown checks {unknown}")
+        rules[name] = tuple(checks)
+    RULES.clear()
+    RULES.update(rules)
+    _PLANS.clear()
+
+def _plan(ln, only):
+    checks = RULES.get(ln, RULES["*"])
+    plan = _PLANS[(only, ln)] = tuple(
+        fn for name in checks for kind, fn in (_CHECKS[name],) if only is None or kind == only
+    )
+    return plan
+
+def attr_issue_kind(ln: str) -> str:
+    """Kind an attribute edit on element `ln` is reported as ("footnote" or "attribute")."""
+    return "footnote" if "footnote" in RULES.get(ln, RULES["*"]) else "attribute"
+
+def issues_for_pair(l_elem, r_elem, only=None, tokens=None):
+    """
+    Issues on ONE aligned pair, exactly as iter_issues would report them.
+    tokens: (left, right) TokenCache; looked up from the elements' documents if omitted.
+    """
+    ln = local_name(l_elem.tag)
+    if ln != local_name(r_elem.tag):
+        return []
+    plan = _PLANS.get((only, ln))
+    if plan is None:
+        plan = _plan(ln, only)
+    if tokens is None:
+        tokens = (cache_for(l_elem.getroottree()), cache_for(r_elem.getroottree()))
+    return [issue for check in plan for issue in check(l_elem, r_elem, tokens)]
+
+def iter_issues(left_tree, right_tree, only=None, progress=None, stop=None):
+    """
+    Lazily yield issues in document order from ONE traversal of the aligned trees.
+    Each element runs the checks its RULES entry lists, in that order.
+    progress: optional callable(scanned=0, issue=None), called with element counts
+    while scanning and with each issue as it is yielded (see _aligned_pairs).
+    stop: optional threading.Event that ends the scan early (see _aligned_pairs).
+    Text is tokenized through the documents' token caches (xml_engine.tokens).
+    """
+    tokens = (cache_for(left_tree), cache_for(right_tree))
+    for l_elem, r_elem in _aligned_pairs(left_tree, right_tree, progress, stop):
+        for issue in issues_for_pair(l_elem, r_elem, only, tokens):
+            if progress is not None:
+                progress(issue=issue)
+            yield issue
+
+def compute_gibberish_issues(left_tree, right_tree, progress=None):
+    return list(iter_issues(left_tree, right_tree, "gibberish", progress))
+
+def compute_footnote_issues(left_tree, right_tree, progress=None):
+    return list(iter_issues(left_tree, right_tree, "footnote", progress))
+
+def compute_attribute_issues(left_tree, right_tree, progress=None):
+    return list(iter_issues(left_tree, right_tree, "attribute", progress))
+
+def compute_duplicate_issues(left_tree, right_tree, progress=None):
+    return list(iter_issues(left_tree, right_tree, "duplicate", progress))
+
+def compute_issues(left_tree, right_tree, only=None, progress=None):
+    """All issues (or only one kind), in document order; see iter_issues."""
+    if only not in ISSUE_KINDS:
+        only = None
+    return list(iter_issues(left_tree, right_tree, only, progress))
+
+class IssueStream:
+    """
+    Thread-safe, caching pull interface over iter_issues: issues are produced only
+    as far as someone asks for them, and `issues` keeps everything produced so far.
+    Setting `stop` ends the scan within PROGRESS_EVERY pairs: the stream is then
+    done, but `stopped` tells it apart from a scan that ran to the end.
+    """
+    def __init__(self, left_tree, right_tree, only=None, progress=None, stop=None):
+        self.issues = []
+        self.by_kind = Counter()
+        self.done = False
+        self.stop = stop if stop is not None else threading.Event()
+        self._it = iter_issues(left_tree, right_tree, only, progress, self.stop)
+        self._lock = threading.Lock()
+
+    @property
+    def stopped(self) -> bool:
+        return self.stop.is_set()
+
+    def pull(self, n: int = 1) -> int:
+        """Produce up to n more issues; returns how many were added."""
+        added = 0
+        with self._lock:
+            while added < n and not self.done:
+                try:
+                    issue = next(self._it)
+                except StopIteration:
+                    self.done = True
+                    break
+                self.issues.append(issue)
+                self.by_kind[issue["kind"]] += 1
+                added += 1
+        return added
+
+    def ensure(self, count: int, kind: Optional[str] = None):
+        """Pull until `count` issues (of `kind`, if given) exist or the scan is finished."""
+        have = (lambda: len(self.issues)) if kind in (None, "all") else (lambda: self.by_kind[kind])
+        while have() < count and not self.done:
+            self.pull(1)
+
+    def drain(self, chunk: int = 1, check=None):
+        """Run the scan to completion (background pass); check() may raise to stop early."""
+        while self.pull(chunk):
+            if check is not None:
+                check()
+
+    def close(self):
+        if not self.done:
+            self.stop.set()   # a pull still scanning gives up the lock within PROGRESS_EVERY pairs
+        with self._lock:
+            self._it.close()
+            self.done = True
+
+# ---------- report export ----------
+
+EXPORT_FORMATS = ("ndjson", "csv")
+EXPORT_FIELDS = ("kind", "left_path", "right_path", "attr", "old", "new", "status")
+# Rows are joined into chunks of about this many characters before being yielded
+EXPORT_CHUNK = 64 * 1024
+
+def export_row(issue: dict, accepted=frozenset()) -> dict:
+    """
+    Flat report row for one issue; tail-text issues have "#tail" path keys.
+    status is the issue's own "status" if it has one, else "accepted" when
+    (left path key, attr) is in `accepted`, else "open".
+    """
+    left = build_path_key(issue["steps"])
+    right = build_path_key(issue.get("steps_right") or issue["steps"])
+    if issue.get("tail"):
+        left, right = left + TAIL, right + TAIL
+    attr = issue.get("attr") or ""
+    status = issue.get("status") or ("accepted" if (left, attr) in accepted else "open")
+    return {
+        "kind": issue["kind"], "left_path": left, "right_path": right, "attr": attr,
+        "old": issue.get("old") or "", "new": issue.get("new") or "", "status": status,
+    }
+
+class _Echo:
+    """File-like object whose write() hands the text back (csv.writer -> str)."""
+    def write(self, s):
+        return s
+
+def export_issues(issues: Iterable[dict], fmt: str = "ndjson", accepted=frozenset()) -> Iterator[str]:
+    """
+    Stream a report of `issues` (any iterable, e.g. iter_issues(...)) as NDJSON or
+    CSV text chunks; CSV starts with a header row. Only one chunk is held at a time,
+    so memory stays flat however many issues there are.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"unknown export format {fmt!r}")
+    if fmt == "csv":
+        writer = csv.writer(_Echo())
+        line = lambda row: writer.writerow([row[f] for f in EXPORT_FIELDS])
+        buf, size = [writer.writerow(EXPORT_FIELDS)], 0
+    else:
+        line = lambda row: json.dumps(row, ensure_ascii=False) + "\n"
+        buf, size = [], 0
+    for issue in issues:
+        text = line(export_row(issue, accepted))
+        buf.append(text)
+        size += len(text)
+        if size >= EXPORT_CHUNK:
+            yield "".join(buf)
+            buf, size = [], 0
+    if buf:
+        yield "".join(buf)
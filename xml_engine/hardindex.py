@@ -1,5 +1,6 @@
 import re
 from typing import Dict, Tuple, List
+from .buffer import MappedDocument, buffer_of
 
 # Robust tag tokenizer using named groups:
 TAG_RE = re.compile(
@@ -7,12 +8,24 @@ TAG_RE = re.compile(
     r"<!--.*?-->"                                   # comment
     r"|<!\[CDATA\[(?P<cdata>.*?)\]\]>"              # CDATA
     r"|<\?(?P<pi>.*?)\?>"                           # PI
-    r"|<(?P<end>/?)(?P<name>[^!\?/\s>][^/\s>]*)\s*(?P<attrs>[^>]*)?(?P<selfclose>/?)>",  # start/end
+    # attrs is lazy so a closing "/>" lands in selfclose, not in attrs
+    r"|<(?P<end>/?)(?P<name>[^!\?/\s>][^/\s>]*)\s*(?P<attrs>[^>]*?)(?P<selfclose>/?)>",  # start/end
 )
 
 # Capture double/single quoted attr values
 ATTR_RE = re.compile(r'([:\w\-\.]+)\s*=\s*("([^"]*)"|\'([^\']*)\')')
 
+# Byte-level twins for mmap-backed documents (offsets are then byte offsets).
+# \w is ASCII-only on bytes, so admit UTF-8 lead/continuation bytes in names.
+TAG_RE_B  = re.compile(TAG_RE.pattern.encode("ascii"))
+ATTR_RE_B = re.compile(rb'([:\w\-\.\x80-\xff]+)\s*=\s*("([^"]*)"|\'([^\']*)\')')
+
+def _patterns(xml):
+    return (TAG_RE, ATTR_RE) if isinstance(xml, str) else (TAG_RE_B, ATTR_RE_B)
+
+def _str(name) -> str:
+    return name if isinstance(name, str) else bytes(name).decode("utf-8", errors="replace")
+
 def local_name(tag: str) -> str:
     if not tag: return ""
     if "}" in tag: tag = tag.split("}", 1)[1]
@@ -23,76 +36,93 @@ def build_path_key(steps: Tuple[Tuple[str, int], ...]) -> str:
     """Stable key like 'fm[1]/toc[1]/entry-num[12]'."""
     return "/".join(f"{ln}[{idx}]" for ln, idx in steps)
 
+TAIL = "#tail"
+
 def index_element_text_spans(xml: str) -> Dict[str, Tuple[int, int]]:
     """
-    Map: path_key -> (start, end) character offsets for element.text ONLY (not tails).
-    We capture the FIRST text segment directly after a start tag, ending before the next '<'.
+    Map: path_key -> (start, end) character offsets for element.text, and
+    path_key + TAIL -> offsets of element.tail (mixed content).
+    .text is the text segment directly after a start tag, ending before the next '<';
+    a tail is the segment directly after an element's end tag (or self-closing tag).
     CDATA blocks are captured as a whole.
+    `xml` may be a str (character offsets) or a MappedDocument (byte offsets).
     """
+    xml = buffer_of(xml)
+    tag_re, _ = _patterns(xml)
     spans: Dict[str, Tuple[int, int]] = {}
 
     class Node:
-        __slots__ = ("ln", "idx", "has_text")
-        def __init__(self, ln: str, idx: int):
-            self.ln, self.idx, self.has_text = ln, idx, False
+        __slots__ = ("key", "has_text")
+        def __init__(self, key: str):
+            self.key, self.has_text = key, False
 
     stack: List[Node] = []
     sib_counts: List[Dict[str, int]] = [{}]
+    # What the previous token was: the element whose start tag it was (its text
+    # follows), the key of the element it closed (its tail follows), or neither
+    opened: Node = None
+    closed: str = None
 
     pos = 0
-    for m in TAG_RE.finditer(xml):
+    for m in tag_re.finditer(xml):
         start, end = m.start(), m.end()
 
-        # Text between tokens → element.text if top of stack hasn't got text yet
+        # Text between tokens → element.text right after a start tag, else a tail
         if start > pos and stack:
-            top = stack[-1]
-            if not top.has_text:
-                key = build_path_key(tuple((n.ln, n.idx) for n in stack))
-                spans[key] = (pos, start)
-                top.has_text = True
+            if opened is not None and not opened.has_text:
+                spans[opened.key] = (pos, start)
+                opened.has_text = True
+            elif closed is not None:
+                spans[closed + TAIL] = (pos, start)
+        opened = closed = None
 
         # CDATA => treat as element.text if not set
         if m.group("cdata") is not None:
             if stack and not stack[-1].has_text:
-                key = build_path_key(tuple((n.ln, n.idx) for n in stack))
-                spans[key] = (start, end)   # include whole CDATA block
+                spans[stack[-1].key] = (start, end)   # include whole CDATA block
                 stack[-1].has_text = True
 
         elif m.group("name") is not None:
-            is_end = (m.group("end") == "/")
-            ln = local_name(m.group("name"))
-            selfclose = (m.group("selfclose") == "/")
+            is_end = bool(m.group("end"))
+            ln = local_name(_str(m.group("name")))
+            selfclose = bool(m.group("selfclose"))
 
             if not is_end:
                 depth = len(stack)
                 if len(sib_counts) <= depth: sib_counts.append({})
                 idx = sib_counts[depth].get(ln, 0) + 1
                 sib_counts[depth][ln] = idx
-                stack.append(Node(ln, idx))
+                step = f"{ln}[{idx}]"
+                node = Node(f"{stack[-1].key}/{step}" if stack else step)
+                stack.append(node)
 
                 if selfclose and stack:
                     stack.pop()
+                    closed = node.key
                 else:
+                    opened = node
                     # reset counters for next depth
                     if len(sib_counts) <= depth + 1: sib_counts.append({})
                     else: sib_counts[depth + 1] = {}
             else:
-                if stack: stack.pop()
+                if stack: closed = stack.pop().key
 
         pos = end
 
     # Trailing text (rare in well-formed XML)
-    if pos < len(xml) and stack and not stack[-1].has_text:
-        key = build_path_key(tuple((n.ln, n.idx) for n in stack))
-        spans[key] = (pos, len(xml))
-        stack[-1].has_text = True
+    if pos < len(xml) and stack and opened is not None and not opened.has_text:
+        spans[opened.key] = (pos, len(xml))
+        opened.has_text = True
 
     return spans
 
 def index_attribute_value_spans(xml: str) -> Dict[str, Tuple[int, int]]:
     """
     Map: path_key@attrLocalName -> (value_start, value_end) offsets (raw, excluding quotes).
+    `xml` may be a str (character offsets) or a MappedDocument (byte offsets).
     """
+    xml = buffer_of(xml)
+    tag_re, attr_re = _patterns(xml)
     out: Dict[str, Tuple[int, int]] = {}
 
     class Node:
@@ -103,14 +133,14 @@ def index_attribute_value_spans(xml: str) -> Dict[str, Tuple[int, int]]:
     stack: List[Node] = []
     sib_counts: List[Dict[str, int]] = [{}]
 
-    for m in TAG_RE.finditer(xml):
+    for m in tag_re.finditer(xml):
         name = m.group("name")
         if name is None:
             continue  # comment, cdata, pi
-        ln = local_name(name)
-        is_end = (m.group("end") == "/")
-        attrs_str = m.group("attrs") or ""
-        selfclose = (m.group("selfclose") == "/")
+        ln = local_name(_str(name))
+        is_end = bool(m.group("end"))
+        attrs_str = m.group("attrs")
+        selfclose = bool(m.group("selfclose"))
 
         if not is_end:
             depth = len(stack)
@@ -126,29 +156,62 @@ def index_attribute_value_spans(xml: str) -> Dict[str, Tuple[int, int]]:
                 attrs_rel_start = tag_text.find(attrs_str)
                 if attrs_rel_start != -1:
                     attrs_abs_start = tag_abs_start + attrs_rel_start
-                    for am in ATTR_RE.finditer(attrs_str):
+                    for am in attr_re.finditer(attrs_str):
                         raw_name = am.group(1)
                         val_span = am.span(3) if am.group(3) is not None else am.span(4)
                         if not val_span: continue
                         val_rel_start, val_rel_end = val_span
                         val_abs_start = attrs_abs_start + val_rel_start
                         val_abs_end   = attrs_abs_start + val_rel_end
-                        key = build_path_key(tuple((n.ln, n.idx) for n in stack)) + "@" + local_name(raw_name)
+                        key = build_path_key(tuple((n.ln, n.idx) for n in stack)) + "@" + local_name(_str(raw_name))
                         out[key] = (val_abs_start, val_abs_end)
 
             if selfclose and stack:
                 stack.pop()
+            else:
+                # fresh sibling counters for this element's children
+                if len(sib_counts) <= depth + 1: sib_counts.append({})
+                else: sib_counts[depth + 1] = {}
         else:
             if stack: stack.pop()
 
     return out
 
+def is_plain_span(xml, start: int, end: int) -> bool:
+    """
+    True if xml[start:end] is character data only and no CDATA section follows it,
+    i.e. the parsed .text/.tail is exactly that span with its entities decoded.
+    """
+    n = end - start
+    seg = xml[start:end + 9]
+    lt, cdata = ("<", "<![CDATA[") if isinstance(seg, str) else (b"<", b"<![CDATA[")
+    return lt not in seg[:n] and not seg[n:].startswith(cdata)
+
+def shift_spans(spans: Dict[str, Tuple[int, int]], start: int, end: int, new_len: int):
+    """
+    Keep a span index valid after raw[start:end] was replaced by new_len units of
+    text containing no markup (a text or attribute value edit): spans after the
+    edit move, the span enclosing it stretches. O(len(spans)), no rescan.
+    """
+    delta = new_len - (end - start)
+    if spans is None or not delta:
+        return spans
+    for key, (s, e) in spans.items():
+        if s <= start and e >= end:
+            spans[key] = (s, e + delta)
+        elif s >= end:
+            spans[key] = (s + delta, e + delta)
+    return spans
+
 def apply_replacements(raw_xml: str, replacements: List[Tuple[int, int, str]]) -> str:
     """
     Apply (start, end, replacement) chunks to raw_xml, in descending start order.
+    A MappedDocument is rewritten on disk (byte offsets) and returned.
     """
     if not replacements:
         return raw_xml
+    if isinstance(raw_xml, MappedDocument):
+        return raw_xml.apply(replacements)
     replacements = sorted(replacements, key=lambda x: x[0], reverse=True)
     out = raw_xml
     for s, e, rep in replacements:
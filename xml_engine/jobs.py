@@ -0,0 +1,97 @@
+import threading
+import uuid
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional
+
+# Parsing and detection run on lxml trees that can't be pickled, so jobs use
+# threads. lxml releases the GIL while parsing, so request threads stay responsive.
+EXECUTOR = ThreadPoolExecutor(max_workers=2, thread_name_prefix="diffjob")
+
+class JobCancelled(Exception):
+    """Raised inside a job's worker once cancel() has been requested."""
+
+class DiffJob:
+    """
+    Progress record for one background parse+detect run. The issues themselves
+    live in the published IssueStream; the job only counts them as they are found.
+    """
+    def __init__(self):
+        self.id = uuid.uuid4().hex[:12]
+        self.status = "queued"       # queued | running | done | cancelled | error
+        self.stage = None            # "parse" | "detect"
+        self.scanned = 0             # aligned element pairs visited (all passes)
+        self.found = 0
+        self.by_kind = Counter()
+        self._counts_lock = threading.Lock()   # progress() runs on the worker, to_dict() on polls
+        self.error = None
+        self.future = None
+        # set by cancel(); handed to the job's IssueStream so the scan itself stops
+        self.stop = threading.Event()
+
+    @property
+    def active(self) -> bool:
+        return self.status in ("queued", "running")
+
+    def cancel(self):
+        self.stop.set()
+        # Not started yet -> drop it from the pool queue right away
+        if self.future is not None and self.future.cancel():
+            self.status = "cancelled"
+
+    def check(self):
+        if self.stop.is_set():
+            raise JobCancelled(self.id)
+
+    def progress(self, scanned: int = 0, issue: Optional[dict] = None):
+        """Callback for iter_issues(progress=...): count elements and issues."""
+        self.scanned += scanned
+        if issue is not None:
+            with self._counts_lock:
+                self.found += 1
+                self.by_kind[issue["kind"]] += 1
+
+    def to_dict(self) -> dict:
+        with self._counts_lock:
+            found, by_kind = self.found, dict(self.by_kind)
+        return {
+            "job": self.id,
+            "status": self.status,
+            "stage": self.stage,
+            "scanned": self.scanned,
+            "found": found,
+            "byKind": by_kind,
+            "error": self.error,
+        }
+
+JOBS: Dict[str, DiffJob] = {}
+MAX_FINISHED_JOBS = 20
+
+def submit_job(fn: Callable[[DiffJob], None],
+               before_start: Optional[Callable[[DiffJob], None]] = None) -> DiffJob:
+    """
+    Run fn(job) on the pool; fn reports progress through the job it is given.
+    before_start(job), if given, runs before the job is queued, so whatever it
+    records (e.g. which job owns the session) is visible to fn.
+    """
+    job = DiffJob()
+
+    def run():
+        job.status = "running"
+        try:
+            fn(job)
+            job.status = "done"
+        except JobCancelled:
+            job.status = "cancelled"
+        except Exception as e:
+            job.status = "error"
+            job.error = str(e)
+
+    finished = [k for k, j in JOBS.items() if not j.active]
+    for k in finished[:max(0, len(finished) - MAX_FINISHED_JOBS)]:
+        del JOBS[k]
+    JOBS[job.id] = job
+    if before_start is not None:
+        before_start(job)
+    job.future = EXECUTOR.submit(run)
+    return job
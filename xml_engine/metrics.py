@@ -0,0 +1,146 @@
+"""
+Lightweight stage timers and histograms, exported in Prometheus text format.
+
+    with stage("parse"):
+        ...
+    observe("xmlproof_document_bytes", len(raw), side="left")
+
+Everything is a no-op until enable() is called, so instrumented code costs one
+flag check per call when metrics are off.
+"""
+import threading
+import time
+from bisect import bisect_left
+from typing import Dict, List, Optional, Tuple
+
+_enabled = False
+
+def enable(on: bool = True):
+    global _enabled
+    _enabled = bool(on)
+
+def enabled() -> bool:
+    return _enabled
+
+# ---------- histograms ----------
+
+TIME_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+SIZE_BUCKETS = tuple(10 ** e for e in range(2, 10))           # 100 .. 1e9
+COUNT_BUCKETS = (0, 1, 10, 100, 1_000, 10_000, 100_000, 1_000_000)
+
+HELP = {
+    "xmlproof_request_seconds":   ("Request latency by route", TIME_BUCKETS),
+    "xmlproof_stage_seconds":     ("Time spent in a processing stage", TIME_BUCKETS),
+    "xmlproof_document_bytes":    ("Size of a raw document handled by a request", SIZE_BUCKETS),
+    "xmlproof_document_elements": ("Element count of a parsed document", COUNT_BUCKETS),
+    "xmlproof_issues":            ("Issue count produced by a request", COUNT_BUCKETS),
+}
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "sum", "count")
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)   # last slot is +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, v: float):
+        self.counts[bisect_left(self.buckets, v)] += 1
+        self.sum += v
+        self.count += 1
+
+_lock = threading.Lock()
+_series: Dict[Tuple[str, Tuple[Tuple[str, str], ...]], Histogram] = {}
+
+def observe(name: str, value: float, **labels):
+    if not _enabled:
+        return
+    key = (name, tuple(sorted((k, str(v)) for k, v in labels.items())))
+    with _lock:
+        h = _series.get(key)
+        if h is None:
+            h = _series[key] = Histogram(HELP[name][1])
+        h.observe(value)
+
+def reset():
+    with _lock:
+        _series.clear()
+
+def _fmt_labels(labels, extra=None):
+    items = list(labels) + ([extra] if extra else [])
+    if not items:
+        return ""
+    esc = lambda v: v.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+    return "{" + ",".join(f'{k}="{esc(v)}"' for k, v in items) + "}"
+
+def render_prometheus() -> str:
+    out: List[str] = []
+    with _lock:
+        snapshot = sorted(_series.items())
+        seen = set()
+        for (name, labels), h in snapshot:
+            if name not in seen:
+                seen.add(name)
+                out.append(f"# HELP {name} {HELP[name][0]}")
+                out.append(f"# TYPE {name} histogram")
+            cum = 0
+            for le, c in zip(h.buckets, h.counts):
+                cum += c
+                out.append(f"{name}_bucket{_fmt_labels(labels, ('le', repr(float(le))))} {cum}")
+            out.append(f"{name}_bucket{_fmt_labels(labels, ('le', '+Inf'))} {h.count}")
+            out.append(f"{name}_sum{_fmt_labels(labels)} {h.sum}")
+            out.append(f"{name}_count{_fmt_labels(labels)} {h.count}")
+    return "\n".join(out) + "\n"
+
+# ---------- per-request stage timing ----------
+
+_local = threading.local()
+
+def begin_request(route: Optional[str]):
+    if not _enabled:
+        return
+    _local.route = route or "unknown"
+    _local.t0 = time.perf_counter()
+    _local.stages = []
+
+def end_request() -> List[Tuple[str, float]]:
+    """Record the request's total time; return its [(stage, seconds)] for Server-Timing."""
+    if not _enabled or getattr(_local, "t0", None) is None:
+        return []
+    observe("xmlproof_request_seconds", time.perf_counter() - _local.t0, route=_local.route)
+    stages, _local.t0, _local.stages, _local.route = _local.stages, None, None, None
+    return stages
+
+class _Stage:
+    __slots__ = ("name", "t0")
+
+    def __init__(self, name):
+        self.name = name
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        dt = time.perf_counter() - self.t0
+        route = getattr(_local, "route", None) or "background"
+        observe("xmlproof_stage_seconds", dt, route=route, stage=self.name)
+        stages = getattr(_local, "stages", None)
+        if stages is not None:
+            stages.append((self.name, dt))
+        return False
+
+class _NullStage:
+    __slots__ = ()
+    def __enter__(self): return self
+    def __exit__(self, *exc): return False
+
+_NULL_STAGE = _NullStage()
+
+def stage(name: str):
+    """Context manager timing one processing stage of the current request."""
+    return _Stage(name) if _enabled else _NULL_STAGE
+
+def server_timing(stages: List[Tuple[str, float]]) -> str:
+    return ", ".join(f"{name};dur={dt * 1000:.2f}" for name, dt in stages)
@@ -4,10 +4,15 @@ import unicodedata
 
 # Escape stray & that are not a valid entity
 ENTITY_PATTERN = re.compile(r'&(?!amp;|lt;|gt;|quot;|apos;|#\d+;|#x[0-9A-Fa-f]+;)')
+ENTITY_PATTERN_B = re.compile(ENTITY_PATTERN.pattern.encode("ascii"))
 
 def preprocess_xml(s: str) -> str:
     return ENTITY_PATTERN.sub('&amp;', s)
 
+def preprocess_xml_bytes(b) -> bytes:
+    """preprocess_xml for UTF-8 bytes / mmap buffers."""
+    return ENTITY_PATTERN_B.sub(b'&amp;', b)
+
 def decode_entities_aggressively(s: str) -> str:
     prev = None
     curr = s
@@ -0,0 +1,230 @@
+"""
+Session snapshots: one binary file holding what a restarted worker needs to
+resume a review without re-running detection.
+
+Layout (little-endian):
+
+    b"XPSNAP"  u16 format version  u16 section count
+    per section:  4-byte tag  u32 flags  u64 payload length  payload
+
+Flag bit 0 marks a zlib-compressed payload. Readers skip unknown tags, so a
+section can be added without breaking older files; changing what an existing
+section means requires bumping FORMAT_VERSION.
+
+    RAWL / RAWR   raw documents, UTF-8
+    META          JSON: position, filter, edit journal, buffer mode, version
+    ISSU          JSON: the issue list
+    TSPL / TSPR   element text span index (left / right)
+    ASPL / ASPR   attribute value span index (left / right)
+
+A span index is stored as u32 key-blob length, the NUL-joined UTF-8 keys, then
+the (start, end) pairs as a flat int64 array.
+
+Moving the review cursor doesn't rewrite the snapshot: the position goes to a
+small JSON sidecar (path + CURSOR_SUFFIX) tagged with the session version, and
+read_cursor() only returns it for the snapshot it belongs to.
+"""
+import contextlib
+import json
+import os
+import struct
+import sys
+import threading
+import traceback
+import zlib
+from array import array
+from typing import Dict, Optional, Tuple
+
+MAGIC = b"XPSNAP"
+FORMAT_VERSION = 1
+
+_HEADER = struct.Struct("<6sHH")
+_SECTION = struct.Struct("<4sIQ")
+_COMPRESSED = 1
+
+SPAN_TAGS = {
+    "left_text_spans": b"TSPL", "right_text_spans": b"TSPR",
+    "left_attr_spans": b"ASPL", "right_attr_spans": b"ASPR",
+}
+
+class SnapshotError(Exception):
+    """The file is not a snapshot this version can read."""
+
+# ---------- encoding ----------
+
+def _encode_spans(spans: Dict[str, Tuple[int, int]]) -> bytes:
+    keys = "\0".join(spans).encode("utf-8")
+    offsets = array("q")
+    for s, e in spans.values():
+        offsets.append(s)
+        offsets.append(e)
+    if sys.byteorder == "big":
+        offsets.byteswap()
+    return struct.pack("<I", len(keys)) + keys + offsets.tobytes()
+
+def _decode_spans(data: bytes) -> Dict[str, Tuple[int, int]]:
+    (n,) = struct.unpack_from("<I", data)
+    keys = data[4:4 + n].decode("utf-8").split("\0") if n else []
+    offsets = array("q")
+    offsets.frombytes(data[4 + n:])
+    if sys.byteorder == "big":
+        offsets.byteswap()
+    it = iter(offsets)
+    return dict(zip(keys, zip(it, it)))
+
+def _as_bytes(raw) -> bytes:
+    return raw.encode("utf-8", errors="replace") if isinstance(raw, str) else bytes(raw)
+
+def encode(data: dict) -> bytes:
+    """
+    data keys: raw_left, raw_right (str or bytes), meta (dict), issues (list),
+    and any of SPAN_TAGS' keys (span dicts, or None to leave them out).
+    """
+    sections = [
+        (b"RAWL", _as_bytes(data["raw_left"])),
+        (b"RAWR", _as_bytes(data["raw_right"])),
+        (b"META", json.dumps(data["meta"], ensure_ascii=False).encode("utf-8")),
+        (b"ISSU", json.dumps(data["issues"], ensure_ascii=False).encode("utf-8")),
+    ]
+    for name, tag in SPAN_TAGS.items():
+        if data.get(name) is not None:
+            sections.append((tag, _encode_spans(data[name])))
+
+    out = [_HEADER.pack(MAGIC, FORMAT_VERSION, len(sections))]
+    for tag, payload in sections:
+        payload = zlib.compress(payload, 1)
+        out.append(_SECTION.pack(tag, _COMPRESSED, len(payload)))
+        out.append(payload)
+    return b"".join(out)
+
+def decode(blob: bytes) -> dict:
+    """Inverse of encode(); span indexes missing from the file come back as None."""
+    if len(blob) < _HEADER.size:
+        raise SnapshotError("truncated header")
+    magic, version, count = _HEADER.unpack_from(blob)
+    if magic != MAGIC:
+        raise SnapshotError("not a session snapshot")
+    if version != FORMAT_VERSION:
+        raise SnapshotError(f"snapshot format {version}, expected {FORMAT_VERSION}")
+
+    raw = {}
+    pos = _HEADER.size
+    for _ in range(count):
+        if pos + _SECTION.size > len(blob):
+            raise SnapshotError("truncated section header")
+        tag, flags, size = _SECTION.unpack_from(blob, pos)
+        pos += _SECTION.size
+        payload = blob[pos:pos + size]
+        if len(payload) != size:
+            raise SnapshotError(f"truncated section {tag!r}")
+        pos += size
+        raw[tag] = zlib.decompress(payload) if flags & _COMPRESSED else payload
+
+    for tag in (b"RAWL", b"RAWR", b"META", b"ISSU"):
+        if tag not in raw:
+            raise SnapshotError(f"missing section {tag.decode()}")
+    out = {
+        "raw_left": raw[b"RAWL"].decode("utf-8"),
+        "raw_right": raw[b"RAWR"].decode("utf-8"),
+        "meta": json.loads(raw[b"META"]),
+        "issues": json.loads(raw[b"ISSU"]),
+    }
+    for name, tag in SPAN_TAGS.items():
+        out[name] = _decode_spans(raw[tag]) if tag in raw else None
+    return out
+
+def read_snapshot(path: str) -> dict:
+    with open(path, "rb") as f:
+        return decode(f.read())
+
+def write_snapshot(path: str, data: dict):
+    """Atomic: readers see the old file or the new one, never a partial write."""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp = f"{path}.tmp"
+    with open(tmp, "wb") as f:
+        f.write(encode(data))
+    os.replace(tmp, path)
+
+# ---------- cursor sidecar ----------
+
+CURSOR_SUFFIX = ".cursor"
+
+def write_cursor(path: str, cursor: dict):
+    """Atomically write the cursor sidecar of the snapshot at `path`."""
+    tmp = f"{path}{CURSOR_SUFFIX}.tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump(cursor, f)
+    os.replace(tmp, path + CURSOR_SUFFIX)
+
+def read_cursor(path: str, version) -> Optional[dict]:
+    """The sidecar cursor if it was written for session `version`, else None."""
+    try:
+        with open(path + CURSOR_SUFFIX, encoding="utf-8") as f:
+            cursor = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return cursor if isinstance(cursor, dict) and cursor.get("version") == version else None
+
+# ---------- background writer ----------
+
+class SnapshotWriter:
+    """
+    Writes snapshots (and cursor sidecars) on one daemon thread. schedule() and
+    schedule_cursor() only hand over the data; when several arrive while a write
+    is running, only the newest of each is written.
+    """
+    def __init__(self, path: str):
+        self.path = path
+        self._pending: Optional[dict] = None
+        self._pending_cursor: Optional[dict] = None
+        self._cond = threading.Condition()
+        self._busy = False
+        self._thread = None
+
+    def schedule(self, data: dict):
+        with self._cond:
+            self._pending = data
+            self._start()
+
+    def schedule_cursor(self, cursor: dict):
+        with self._cond:
+            self._pending_cursor = cursor
+            self._start()
+
+    def _start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="snapshot", daemon=True)
+            self._thread.start()
+        self._cond.notify()
+
+    def _idle(self) -> bool:
+        return self._pending is None and self._pending_cursor is None and not self._busy
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until everything scheduled so far is on disk."""
+        with self._cond:
+            return self._cond.wait_for(self._idle, timeout)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                self._cond.wait_for(lambda: self._pending is not None or self._pending_cursor is not None)
+                data, cursor = self._pending, self._pending_cursor
+                self._pending = self._pending_cursor = None
+                self._busy = True
+            try:
+                # snapshot first: a cursor names the version it belongs to
+                if data is not None:
+                    write_snapshot(self.path, data)
+                    if cursor is None:
+                        # versions restart with the process: drop an older session's cursor
+                        with contextlib.suppress(FileNotFoundError):
+                            os.remove(self.path + CURSOR_SUFFIX)
+                if cursor is not None:
+                    write_cursor(self.path, cursor)
+            except Exception:
+                traceback.print_exc()
+            finally:
+                with self._cond:
+                    self._busy = False
+                    self._cond.notify_all()
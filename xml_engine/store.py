@@ -0,0 +1,183 @@
+"""
+Persistence backends for the review log (accepted edits, final versions).
+
+    store = open_store("sqlite", path="work/xmlproof.sqlite3")
+    store.insert("accepted", {"kind": "text", ...})
+
+Every backend connects lazily on the first write, so creating one never
+touches the network or the disk. Documents are plain dicts of JSON-able
+values, plus bytes for UTF-8 document bodies (tuples come back as lists, and
+bytes as str, from the SQLite store).
+
+Requests don't wait on the backend: BackgroundStore queues inserts for one
+writer thread, so a slow or failing database can't hold up (or fail) an edit.
+"""
+import copy
+import json
+import os
+import queue
+import sqlite3
+import threading
+import traceback
+from collections import defaultdict
+from typing import Dict, List, Optional
+
+class Store:
+    """Interface: insert() one document into a named collection; close() releases connections."""
+    def insert(self, collection: str, doc: dict):
+        raise NotImplementedError
+
+    def close(self):
+        pass
+
+class MemoryStore(Store):
+    """Process-local lists; for tests, benchmarks and throwaway sessions."""
+    def __init__(self):
+        self.collections: Dict[str, List[dict]] = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def insert(self, collection, doc):
+        with self._lock:
+            self.collections[collection].append(copy.copy(doc))
+
+def _json_default(value):
+    # document bodies may arrive as UTF-8 bytes: decoding them here, on the writer
+    # thread, keeps that cost off the request
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        return bytes(value).decode("utf-8", errors="replace")
+    return str(value)
+
+class SqliteStore(Store):
+    """Embedded SQLite file, one table per collection holding JSON documents."""
+    def __init__(self, path: str):
+        self.path = path
+        self._conn = None
+        self._tables = set()
+        self._lock = threading.Lock()
+
+    def _connect(self):
+        if self._conn is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            # one shared connection, serialized by _lock (request threads + jobs)
+            self._conn = sqlite3.connect(self.path, check_same_thread=False)
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+        return self._conn
+
+    def insert(self, collection, doc):
+        if not collection.isidentifier():
+            raise ValueError(f"bad collection name {collection!r}")
+        body = json.dumps(doc, ensure_ascii=False, default=_json_default)
+        with self._lock:
+            conn = self._connect()
+            if collection not in self._tables:
+                conn.execute(f"CREATE TABLE IF NOT EXISTS {collection} ("
+                             "id INTEGER PRIMARY KEY AUTOINCREMENT, doc TEXT NOT NULL)")
+                self._tables.add(collection)
+            conn.execute(f"INSERT INTO {collection} (doc) VALUES (?)", (body,))
+            conn.commit()
+
+    def find(self, collection) -> List[dict]:
+        with self._lock:
+            if collection not in self._tables:
+                conn = self._connect()
+                exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type='table' AND name=?",
+                                      (collection,)).fetchone()
+                if not exists:
+                    return []
+            rows = self._connect().execute(f"SELECT doc FROM {collection} ORDER BY id").fetchall()
+        return [json.loads(doc) for (doc,) in rows]
+
+    def close(self):
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+                self._tables.clear()
+
+class MongoStore(Store):
+    """
+    MongoDB through one pooled pymongo client, created on the first write.
+    pymongo is only imported then, so other backends don't need the driver.
+    """
+    def __init__(self, uri: str, pool_size: int = 10, timeout_ms: int = 5000):
+        self.uri = uri
+        self.pool_size = pool_size
+        self.timeout_ms = timeout_ms
+        self._client = None
+        self._db = None
+        self._lock = threading.Lock()
+
+    def _database(self):
+        if self._db is None:
+            with self._lock:
+                if self._db is None:
+                    from pymongo import MongoClient
+                    self._client = MongoClient(self.uri, maxPoolSize=self.pool_size,
+                                               serverSelectionTimeoutMS=self.timeout_ms)
+                    self._db = self._client.get_default_database("xml_proofing")
+        return self._db
+
+    def insert(self, collection, doc):
+        self._database()[collection].insert_one(dict(doc))
+
+    def close(self):
+        with self._lock:
+            if self._client is not None:
+                self._client.close()
+            self._client = self._db = None
+
+class BackgroundStore(Store):
+    """
+    Wraps a backend: insert() only queues the document, a daemon thread writes
+    them in order. A failed write is logged and dropped; it never reaches the
+    caller, which has already moved on.
+    """
+    def __init__(self, backend: Store):
+        self.backend = backend
+        self._queue: "queue.Queue" = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+
+    def insert(self, collection, doc):
+        self._queue.put((collection, doc))
+        if self._thread is None:
+            with self._lock:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="store", daemon=True)
+                    self._thread.start()
+
+    def _run(self):
+        while True:
+            collection, doc = self._queue.get()
+            try:
+                self.backend.insert(collection, doc)
+            except Exception:
+                traceback.print_exc()
+            finally:
+                self._queue.task_done()
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until everything queued so far has been written (or has failed)."""
+        with self._queue.all_tasks_done:
+            return self._queue.all_tasks_done.wait_for(lambda: not self._queue.unfinished_tasks, timeout)
+
+    def close(self):
+        self.flush()
+        self.backend.close()
+
+BACKENDS = ("mongo", "sqlite", "memory")
+
+def open_store(backend: str, **options) -> Store:
+    """
+    backend "mongo":  options uri, pool_size
+            "sqlite": option path
+            "memory": no options
+    """
+    if backend == "mongo":
+        return MongoStore(options["uri"], pool_size=int(options.get("pool_size") or 10))
+    if backend == "sqlite":
+        return SqliteStore(options["path"])
+    if backend == "memory":
+        return MemoryStore()
+    raise ValueError(f"unknown STORE backend {backend!r} (expected one of {', '.join(BACKENDS)})")
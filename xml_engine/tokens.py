@@ -0,0 +1,111 @@
+"""
+Per-document token cache: each element's text (and tail) is tokenized and
+case-folded once, then shared by duplicate detection, highlighting and the
+inline diff shown at render time.
+
+    tokens = cache_for(tree)
+    t = tokens.get(elem)            # .text; tokens.get(elem, "tail") for .tail
+    t.words, t.keys, t.counts       # WORD_RE spans, casefolded keys, key counts
+    t.parts, t.part_keys            # split_tokens() pieces and their diff keys
+
+Entries are keyed by element, so anything that edits an element's text must
+call tokens.invalidate(elem); a reparsed document simply gets a new cache.
+"""
+import re
+import threading
+from collections import Counter, OrderedDict
+from typing import Optional, Tuple
+
+from .utils import diff_key, split_tokens
+
+WORD_RE = re.compile(r"[^\W\d_]+(?:['’][^\W\d_]+)?", re.UNICODE)
+
+class TextTokens:
+    """
+    Tokens of one text. The casefolded keys and their counts, which every
+    duplicate check needs, are built up front; word offsets (for highlighting)
+    and diff pieces only when asked for.
+    """
+    __slots__ = ("text", "keys", "counts", "_words", "_parts", "_part_keys")
+
+    def __init__(self, text: Optional[str]):
+        # Tuples and plain dicts of str/int: the cyclic GC stops tracking them, so
+        # a whole document's entries don't make every collection slower
+        self.text = text = text or ""
+        self.keys = keys = tuple(w.casefold() for w in WORD_RE.findall(text))
+        self.counts = dict(Counter(keys)) if keys else {}
+        self._words = self._parts = self._part_keys = None
+
+    @property
+    def words(self) -> Tuple[Tuple[str, int, int], ...]:
+        """(word, start, end) for every WORD_RE match, parallel to .keys."""
+        if self._words is None:
+            self._words = tuple((m.group(0), m.start(), m.end()) for m in WORD_RE.finditer(self.text))
+        return self._words
+
+    @property
+    def parts(self) -> Tuple[str, ...]:
+        """split_tokens(): words, punctuation runs and whitespace covering the text."""
+        if self._parts is None:
+            self._parts = tuple(split_tokens(self.text))
+        return self._parts
+
+    @property
+    def part_keys(self) -> Tuple[str, ...]:
+        """Comparison keys for .parts (see utils.diff_key)."""
+        if self._part_keys is None:
+            self._part_keys = tuple(diff_key(t) for t in self.parts)
+        return self._part_keys
+
+class TokenCache:
+    """TextTokens of one document's elements, for their .text and their .tail."""
+    def __init__(self):
+        # keyed by the element itself: no (elem, part) tuples for the GC to track
+        self._parts = {"text": {}, "tail": {}}
+
+    def get(self, elem, part: str = "text") -> TextTokens:
+        entries = self._parts[part]
+        t = entries.get(elem)
+        if t is None:
+            t = entries[elem] = TextTokens(elem.text if part == "text" else elem.tail)
+        return t
+
+    def invalidate(self, elem):
+        for entries in self._parts.values():
+            entries.pop(elem, None)
+
+    def __len__(self):
+        return sum(map(len, self._parts.values()))
+
+# ---------- one cache per document ----------
+
+# lxml objects can't be weakly referenced, so caches are held for the most
+# recently used roots only (a review session uses two documents at a time)
+MAX_DOCUMENTS = 4
+_caches = OrderedDict()   # id(root) -> (root, TokenCache)
+_lock = threading.Lock()
+
+def _root(tree):
+    return tree.getroot() if hasattr(tree, "getroot") else tree
+
+def cache_for(tree) -> TokenCache:
+    """The token cache of the document `tree` (an ElementTree or its root element)."""
+    root = _root(tree)
+    with _lock:
+        hit = _caches.get(id(root))
+        if hit is not None and hit[0] is root:
+            _caches.move_to_end(id(root))
+            return hit[1]
+        cache = TokenCache()
+        _caches[id(root)] = (root, cache)
+        while len(_caches) > MAX_DOCUMENTS:
+            _caches.popitem(last=False)
+        return cache
+
+def forget(tree):
+    """Drop the cache of a document that is no longer in use."""
+    root = _root(tree)
+    with _lock:
+        hit = _caches.get(id(root))
+        if hit is not None and hit[0] is root:
+            del _caches[id(root)]
@@ -29,6 +29,35 @@ def build_path(elem: LET._Element):
         cur = cur.getparent()
     return tuple(reversed(steps))
 
+def find_by_steps(root: LET._Element, steps):
+    """Inverse of build_path: the element at `steps` under root, or None."""
+    if not steps or local_name(root.tag) != steps[0][0] or steps[0][1] != 1:
+        return None
+    cur = root
+    for ln, idx in steps[1:]:
+        same = [e for e in cur if isinstance(e.tag, str) and local_name(e.tag) == ln]
+        if not (1 <= idx <= len(same)):
+            return None
+        cur = same[idx - 1]
+    return cur
+
+def doc_order_key(root: LET._Element, steps):
+    """Sortable document-order position of the element at `steps` (child offsets from root)."""
+    key = []
+    cur = root
+    for ln, idx in steps[1:]:
+        n = 0
+        for pos, child in enumerate(cur):
+            if isinstance(child.tag, str) and local_name(child.tag) == ln:
+                n += 1
+                if n == idx:
+                    key.append(pos)
+                    cur = child
+                    break
+        else:
+            break
+    return tuple(key)
+
 # ---------- HTML escaping ----------
 
 def escape_xml(s: str) -> str:
@@ -42,22 +71,30 @@ TOKEN_RE = re.compile(r'[\w\-]+|[^\s\w]+|\s+')
 def split_tokens(s: str):
     return TOKEN_RE.findall(s) or [s]
 
-def token_diff_html(old_text: str, new_text: str):
+def diff_key(t: str) -> str:
+    return " " if t.isspace() else t.casefold()
+
+def token_diff_html(old_text: str, new_text: str, old_tokens=None, new_tokens=None):
     """
     Returns a pair (left_html, right_html) highlighting:
       - deletions in LEFT with .editOldInline
       - insertions in RIGHT with .editNewInline
+    old_tokens / new_tokens: optional cached tokens of the same texts (anything with
+    .text, .parts and .part_keys, e.g. xml_engine.tokens.TextTokens); used only when
+    their text matches, so a stale entry just means tokenizing again.
     """
-    a = split_tokens(old_text or "")
-    b = split_tokens(new_text or "")
-
-    def keyify(tokens):
-        out = []
-        for t in tokens:
-            out.append(" " if t.isspace() else t.casefold())
-        return out
-
-    sm = difflib.SequenceMatcher(a=keyify(a), b=keyify(b), autojunk=False)
+    if old_tokens is not None and old_tokens.text == (old_text or ""):
+        a, ka = old_tokens.parts, old_tokens.part_keys
+    else:
+        a = split_tokens(old_text or "")
+        ka = [diff_key(t) for t in a]
+    if new_tokens is not None and new_tokens.text == (new_text or ""):
+        b, kb = new_tokens.parts, new_tokens.part_keys
+    else:
+        b = split_tokens(new_text or "")
+        kb = [diff_key(t) for t in b]
+
+    sm = difflib.SequenceMatcher(a=ka, b=kb, autojunk=False)
     L, R = [], []
     for tag, i1, i2, j1, j2 in sm.get_opcodes():
         a_seg = "".join(a[i1:i2])
@@ -83,31 +120,28 @@ def render_full_tree_with_injected(root: LET._Element, steps, injected_html: str
         <span id="focusAnchor" class="focusTarget"> {injected_html} </span>
       - if kind == "attr": wrap ONLY the specified attribute value on that element
         with the same anchor span (value is HTML-escaped).
+      - if kind == "tail": like "text", but for the text after the element (.tail).
 
     Parameters:
       root:  lxml element (root)
       steps: tuple of (localName, index) path to the target element
       injected_html: already-diffed HTML fragment to place for the text case
-      kind: "text" or "attr"
+      kind: "text", "tail" or "attr"
       attr: attribute name (local) when kind == "attr"
     """
     target_attr_local = (attr or "").split(":")[-1] if attr else None
+    # Resolve the target once instead of rebuilding every element's path
+    target = find_by_steps(root, tuple(tuple(s) for s in steps or ()))
 
     def render_elem(elem: LET._Element):
         if not isinstance(elem.tag, str):
             return ""
-        # Build path to decide if this is the target element
-        cur = elem
-        tmp = []
-        while cur is not None and isinstance(cur.tag, str):
-            tmp.append((local_name(cur.tag), _index_in_parent(cur)))
-            cur = cur.getparent()
-        is_target = (tuple(reversed(tmp)) == steps)
+        is_target = elem is target
 
         # Render attributes (escape values), and inject focus if kind == "attr" and is_target
         attr_items = []
         for k, v in elem.attrib.items():
-            ln = k.split(":")[-1]
+            ln = local_name(k)
             if is_target and kind == "attr" and target_attr_local == ln:
                 val_html = f'<span id="focusAnchor" class="focusTarget">{html.escape(v, quote=True)}</span>'
             else:
@@ -129,7 +163,10 @@ def render_full_tree_with_injected(root: LET._Element, steps, injected_html: str
         for child in elem:
             inner += render_elem(child)
             if child.tail:
-                inner += escape_xml(child.tail)
+                if kind == "tail" and child is target:
+                    inner += f'<span id="focusAnchor" class="focusTarget">{injected_html}</span>'
+                else:
+                    inner += escape_xml(child.tail)
 
         return open_tag + inner + close_tag
 